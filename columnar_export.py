@@ -0,0 +1,223 @@
+"""
+Columnar export of enriched flights and sims for analytics
+Records from the parser pipeline or from logbook_flights, read in chunks, are buffered in
+typed arrays (a few bytes per value rather than a python object) and written on close as a
+NumPy .npz (or Parquet when the file name ends .parquet and pyarrow is installed)
+Times are epoch seconds (UTC), durations are seconds and airports, registrations and other
+text columns are dictionary encoded as int32 codes into a '<column>.dictionary' array.
+Unknown integer values, e.g. PF for flights from a report without crew details, are -1.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import array
+import calendar
+
+import pipeline_stats
+
+# (name, array typecode) per table, 'dict' columns are dictionary encoded text
+flight_columns = (
+    ('dep_time', 'q'), ('arr_time', 'q'), ('block_time', 'i'), ('night_time', 'i'),
+    ('dep_airport', 'dict'), ('arr_airport', 'dict'), ('registration', 'dict'), ('aircraft_type', 'dict'),
+    ('name_pic', 'dict'), ('function', 'dict'), ('pf', 'b'), ('ldg_day', 'h'), ('ldg_night', 'h'), ('instr', 'b'))
+
+sim_columns = (
+    ('dep_time', 'q'), ('arr_time', 'q'), ('duration', 'i'), ('sim_place', 'dict'), ('training_type', 'dict'))
+
+# airports share one dictionary so departure and arrival codes can be compared directly
+shared_dictionaries = {'dep_airport': 'airport', 'arr_airport': 'airport'}
+
+db_query = 'SELECT F.ID, F.Dep_Time, F.Arr_Time, F.Night_Time, F.Dep_Place, F.Arr_Place, LA.Registration, ' \
+           'LT.Type, F.Name_PIC, F.Function, F.PF, F.Ldg_Day, F.Ldg_Night, F.Instr_Time FROM logbook_flights F ' \
+           'LEFT JOIN logbook_aircraft LA ON LA.ID = F.Aircraft ' \
+           'LEFT JOIN logbook_aircraft_type LT ON LT.ID = LA.Type ' \
+           'WHERE F.ID > %s ORDER BY F.ID LIMIT %s'
+
+
+def epoch(dt):
+    """ seconds since 1970 for a naive UTC or timezone aware datetime """
+    return calendar.timegm(dt.utctimetuple())
+
+
+def seconds(td):
+    return int(round(td.total_seconds())) if td is not None else -1
+
+
+def text(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf8')
+    return '' if value is None else str(value)
+
+
+def integer(value):
+    return -1 if value is None else int(value)
+
+
+class ColumnTable(object):
+    """
+    Typed column buffers for one table. Numeric columns are held in array.array so
+    each value costs its machine size rather than a python object.
+    """
+
+    def __init__(self, columns, dictionaries):
+        self.columns = columns
+        self.rows = 0
+        self.__data = {}
+        self.__dictionaries = dictionaries  # dictionary name -> {value: code}
+        for name, typecode in columns:
+            self.__data[name] = array.array('i' if typecode == 'dict' else typecode)
+
+    def append(self, row):
+        """ row is a dictionary of column name -> value, text for 'dict' columns """
+        for name, typecode in self.columns:
+            value = row[name]
+            if typecode == 'dict':
+                codes = self.__dictionaries.setdefault(shared_dictionaries.get(name, name), {})
+                code = codes.get(value)
+                if code is None:
+                    code = codes[value] = len(codes)
+                value = code
+            self.__data[name].append(value)
+        self.rows += 1
+
+    def column(self, name):
+        return self.__data[name]
+
+    def dictionary_name(self, name):
+        return shared_dictionaries.get(name, name)
+
+
+class ColumnarWriter(object):
+    """
+    Collects flights and sims and writes them to a .npz or .parquet file on close.
+    """
+
+    def __init__(self, output_file_name):
+        self.output_file_name = output_file_name
+        self.dictionaries = {}
+        self.flights = ColumnTable(flight_columns, self.dictionaries)
+        self.sims = ColumnTable(sim_columns, self.dictionaries)
+
+    def add_flight(self, flight):
+        """ adds an enriched flight dictionary from ecrew_sql.enrich_flight """
+        self.flights.append({
+            'dep_time': epoch(flight['dep_time']), 'arr_time': epoch(flight['arr_time']),
+            'block_time': seconds(flight['arr_time'] - flight['dep_time']),
+            'night_time': seconds(flight.get('night_time')),
+            'dep_airport': flight.get('dep_ICAO', flight['dep_place']),
+            'arr_airport': flight.get('arr_ICAO', flight['arr_place']),
+            'registration': flight['reg'], 'aircraft_type': flight.get('aircraft_type', ''),
+            'name_pic': flight['name_pic'],
+            'function': flight.get('function', 'P1' if flight['name_pic'] == 'Self' else 'FO'),
+            'pf': flight.get('PF', -1), 'ldg_day': flight.get('ldg_day', -1), 'ldg_night': flight.get('ldg_ngt', -1),
+            'instr': flight.get('instr', -1)})
+
+    def add_sim(self, sim):
+        self.sims.append({
+            'dep_time': epoch(sim['dep_time']), 'arr_time': epoch(sim['arr_time']),
+            'duration': seconds(sim['arr_time'] - sim['dep_time']),
+            'sim_place': sim['sim_place'], 'training_type': sim['training_type']})
+
+    def add_db_row(self, row):
+        """ adds a row of db_query """
+        self.flights.append({
+            'dep_time': epoch(row[1]), 'arr_time': epoch(row[2]), 'block_time': seconds(row[2] - row[1]),
+            'night_time': seconds(row[3]), 'dep_airport': text(row[4]), 'arr_airport': text(row[5]),
+            'registration': text(row[6]), 'aircraft_type': text(row[7]), 'name_pic': text(row[8]),
+            'function': text(row[9]), 'pf': integer(row[10]), 'ldg_day': integer(row[11]),
+            'ldg_night': integer(row[12]), 'instr': 0 if row[13] is None else int(row[13].total_seconds() > 0)})
+
+    def dictionary_values(self, dictionary_name):
+        codes = self.dictionaries.get(dictionary_name, {})
+        values = [''] * len(codes)
+        for value, code in codes.items():
+            values[code] = value
+        return values
+
+    def close(self):
+        with pipeline_stats.timer('write columnar file'):
+            if self.output_file_name.endswith('.parquet'):
+                self.__write_parquet()
+            else:
+                self.__write_npz()
+
+    def __write_npz(self):
+        import numpy
+
+        arrays = {}
+        for prefix, table in (('flights', self.flights), ('sims', self.sims)):
+            for name, typecode in table.columns:
+                arrays[prefix + '.' + name] = numpy.frombuffer(table.column(name), dtype=table.column(name).typecode) \
+                    if table.rows else numpy.zeros(0, dtype=table.column(name).typecode)
+                if typecode == 'dict':
+                    arrays[prefix + '.' + name + '.dictionary'] = \
+                        numpy.array(self.dictionary_values(table.dictionary_name(name)), dtype=str)
+        numpy.savez_compressed(self.output_file_name, **arrays)
+
+    def __write_parquet(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        types = {'q': pyarrow.int64(), 'i': pyarrow.int32(), 'h': pyarrow.int16(),
+                 'b': pyarrow.int8()}
+        file_names = (self.output_file_name, self.output_file_name[:-len('.parquet')] + '_sims.parquet')
+        for file_name, table in zip(file_names, (self.flights, self.sims)):
+            columns = []
+            for name, typecode in table.columns:
+                if typecode == 'dict':
+                    columns.append(pyarrow.DictionaryArray.from_arrays(
+                        pyarrow.array(table.column(name), type=pyarrow.int32()),
+                        pyarrow.array(self.dictionary_values(table.dictionary_name(name)), type=pyarrow.string())))
+                else:
+                    columns.append(pyarrow.array(table.column(name), type=types[typecode]))
+            pyarrow.parquet.write_table(pyarrow.Table.from_arrays(columns, [name for name, _ in table.columns]),
+                                        file_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def export_reports(writer, file_names, reference, zenith='civil'):
+    """ parses reports and adds their flights and sims, flights with airports missing from
+        reference are skipped; aircraft_type is looked up through reference, empty if unknown;
+        returns the number of flights skipped """
+    import ecrew_pilot_log
+    import ecrew_sql
+
+    skipped = 0
+    for file_name in file_names:
+        flight_dict, sim_dict = ecrew_pilot_log.process_ecrew_logbook_report(file_name)
+        ecrew_sql.strip_registrations(flight_dict)
+        for flight in flight_dict:
+            if not reference.airport(flight['dep_place']) or not reference.airport(flight['arr_place']):
+                skipped += 1
+                continue
+            ecrew_sql.enrich_flight(flight, reference, zenith)
+            flight['aircraft_type'] = reference.aircraft_type(flight['reg']) or ''
+            writer.add_flight(flight)
+        for sim in sim_dict:
+            writer.add_sim(sim)
+    return skipped
+
+
+def export_database(writer, cnx, chunk_size=10000):
+    """ reads logbook_flights in ID order, chunk_size rows per query, so the result set
+        is never held on the client in full """
+    cursor = cnx.cursor()
+    last_id = 0
+    while True:
+        pipeline_stats.count('db round trips')
+        with pipeline_stats.timer('fetch chunk'):
+            cursor.execute(db_query, (last_id, chunk_size))
+            rows = cursor.fetchall()
+        for row in rows:
+            writer.add_db_row(row)
+        if len(rows) < chunk_size:
+            break
+        last_id = rows[-1][0]
+    cursor.close()
@@ -0,0 +1,231 @@
+"""
+Command line interface for the eCrew logbook tools
+    ecrew_logbook.py parse flights.htm
+    ecrew_logbook.py validate flights.htm
+    ecrew_logbook.py import flights.htm [--format insert|csv|tsv] [--dry-run --airports airports.csv]
+    ecrew_logbook.py recheck-night [ICAO ...] [--dry-run]
+    ecrew_logbook.py serve [--host 127.0.0.1] [--port 8642] [--workers N]
+    ecrew_logbook.py export flights.npz [--report flights.htm ... [--airports airports.csv]]
+Global options --stats and --stats-json FILE report the per-stage counters and timers,
+--profile FILE runs the command under cProfile and writes the stats to FILE
+Modules are imported by the subcommand that needs them, so parsing and dry runs never load
+mysql.connector or ecrew_sql_settings
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import sys
+
+
+def parse_report(args):
+    import ecrew_pilot_log
+
+    flight_dict, sim_dict = ecrew_pilot_log.process_ecrew_logbook_report(args.file)
+    print(str(len(flight_dict)) + ' flights and ' + str(len(sim_dict)) + ' sims were successfully read')
+    if args.verbose:
+        for flight in flight_dict:
+            print(flight['dep_time'].strftime('%Y-%m-%d %H:%M'), flight['dep_place'], flight['arr_place'],
+                  flight['arr_time'].strftime('%H:%M'), flight['reg'], flight['name_pic'])
+        for sim in sim_dict:
+            print(sim['dep_time'].strftime('%Y-%m-%d %H:%M'), sim['sim_place'],
+                  sim['arr_time'].strftime('%H:%M'), sim['training_type'])
+    return 0
+
+
+def reference_data(args):
+    """ returns (reference lookups, connection or None) """
+    import ecrew_sql
+
+    if args.airports:
+        return ecrew_sql.AirportFile(args.airports), None
+    print('Opening database connection')
+    cnx = ecrew_sql.connect()
+    return ecrew_sql.ReferenceData(cnx.cursor(raw=True)), cnx
+
+
+def validate_report(args):
+    import ecrew_pilot_log
+    import ecrew_sql
+
+    flight_dict, sim_dict = ecrew_pilot_log.process_ecrew_logbook_report(args.file)
+    ecrew_sql.strip_registrations(flight_dict)
+    reference, cnx = reference_data(args)
+    missing_airports, missing_aircraft = ecrew_sql.missing_reference_data(reference, flight_dict, cnx is not None)
+    if cnx is not None:
+        cnx.close()
+
+    if missing_airports:
+        print('Following airports missing: (' + ', '.join(sorted(missing_airports)) + ')')
+    if missing_aircraft:
+        print('Following aircraft missing: (' + ', '.join(sorted(missing_aircraft)) + ')')
+    if missing_airports or missing_aircraft:
+        return 1
+    print(str(len(flight_dict)) + ' flights are ready to import')
+    return 0
+
+
+def import_report(args):
+    import ecrew_sql
+
+    if not args.dry_run:
+        return ecrew_sql.main(args.file, args.format, args.output, args.zenith)
+
+    # dry run - parse and compute night time from an airports file without a database
+    import ecrew_pilot_log
+    import night_calc
+
+    if not args.airports:
+        print('--dry-run needs --airports with IATA,ICAO,Latitude,Longitude rows')
+        return 2
+    flight_dict, sim_dict = ecrew_pilot_log.process_ecrew_logbook_report(args.file)
+    ecrew_sql.strip_registrations(flight_dict)
+    reference = ecrew_sql.AirportFile(args.airports)
+    missing_airports = ecrew_sql.missing_reference_data(reference, flight_dict, False)[0]
+    if missing_airports:
+        print('Following airports missing from ' + args.airports + ': (' + ', '.join(sorted(missing_airports)) + ')')
+        return 1
+
+    for flight in flight_dict:
+        night_arrival = ecrew_sql.enrich_flight(flight, reference, args.zenith)
+        print(flight['dep_ICAO'], flight['arr_ICAO'], flight['dep_time'].strftime(ecrew_sql.dform),
+              flight['arr_time'].strftime(ecrew_sql.dform), night_calc.td_hhmm(flight['total_time']),
+              'night ' + night_calc.td_hhmm(flight['night_time']), 'N' if night_arrival else 'D', flight['reg'])
+    print(str(len(flight_dict)) + ' flights processed, nothing written to the database')
+    return 0
+
+
+def recheck_night(args):
+    if args.airport:
+        import night_recompute
+
+        night_recompute.main(args.airport, args.zenith, args.dry_run, args.turbine_only)
+    else:
+        import night_hour_checker
+
+        night_hour_checker.main(args.zenith)
+    return 0
+
+
+def serve(args):
+    import ecrew_service
+
+    ecrew_service.serve(args.host, args.port, args.workers, args.db_connections)
+    return 0
+
+
+def export_columnar(args):
+    import columnar_export
+    import ecrew_sql
+
+    writer = columnar_export.ColumnarWriter(args.output)
+    cnx = None
+    if args.airports:
+        # aircraft types are left empty without the database
+        reference = ecrew_sql.AirportFile(args.airports)
+    else:
+        print('Opening database connection')
+        cnx = ecrew_sql.connect()
+        reference = ecrew_sql.ReferenceData(cnx.cursor(raw=True))
+
+    try:
+        if args.report:
+            skipped = columnar_export.export_reports(writer, args.report, reference, args.zenith)
+            if skipped:
+                print(str(skipped) + ' flights skipped with airports missing')
+        else:
+            columnar_export.export_database(writer, cnx, args.chunk_size)
+    finally:
+        if cnx is not None:
+            print('Closing database connection')
+            cnx.close()
+
+    writer.close()
+    print(str(writer.flights.rows) + ' flights and ' + str(writer.sims.rows) + ' sims saved as ' + args.output)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ecrew-logbook', description='eCrew logbook report tools')
+    parser.add_argument('--stats', action='store_true', help='print per-stage counters and timers')
+    parser.add_argument('--stats-json', metavar='FILE', help='write per-stage counters and timers as JSON')
+    parser.add_argument('--profile', metavar='FILE', help='run under cProfile and write the stats to FILE')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    sub = subparsers.add_parser('parse', help='read a report and list its flights and sims')
+    sub.add_argument('file', help='eCrew logbook report saved as .htm')
+    sub.add_argument('-v', '--verbose', action='store_true', help='list every entry')
+    sub.set_defaults(func=parse_report)
+
+    sub = subparsers.add_parser('validate', help='check airports and aircraft are in the database')
+    sub.add_argument('file', help='eCrew logbook report saved as .htm')
+    sub.add_argument('--airports', help='check airports against a csv file instead of the database')
+    sub.set_defaults(func=validate_report)
+
+    sub = subparsers.add_parser('import', help='import a report into the database and write an sql file')
+    sub.add_argument('file', help='eCrew logbook report saved as .htm')
+    sub.add_argument('--format', choices=('insert', 'csv', 'tsv'), help='sql file format, prompted if not given')
+    sub.add_argument('--output', default='new_flights.sql', help='sql file name (default new_flights.sql)')
+    sub.add_argument('--dry-run', action='store_true', help='parse and compute night time only, no database')
+    sub.add_argument('--airports', help='csv of IATA,ICAO,Latitude,Longitude for --dry-run')
+    sub.add_argument('--zenith', default='civil')
+    sub.set_defaults(func=import_report)
+
+    sub = subparsers.add_parser('recheck-night', help='recalculate night time for flights in the database')
+    sub.add_argument('airport', nargs='*', help='only flights using these ICAO codes, all turbine flights if none')
+    sub.add_argument('--zenith', default='civil')
+    sub.add_argument('--dry-run', action='store_true', help='list changes without updating the database')
+    sub.add_argument('--turbine-only', action='store_true', help='with airports, only flights in turbine aircraft')
+    sub.set_defaults(func=recheck_night)
+
+    sub = subparsers.add_parser('serve', help='run the import service with warm caches')
+    sub.add_argument('--host', default='127.0.0.1')
+    sub.add_argument('--port', type=int, default=8642)
+    sub.add_argument('--workers', type=int, help='worker processes (default one per CPU)')
+    sub.add_argument('--db-connections', type=int, default=5, help='database connection pool size')
+    sub.set_defaults(func=serve)
+
+    sub = subparsers.add_parser('export', help='write flights and sims to a columnar .npz or .parquet file')
+    sub.add_argument('output', help='output file name ending .npz or .parquet')
+    sub.add_argument('--report', nargs='+', help='export these reports instead of logbook_flights')
+    sub.add_argument('--airports', help='with --report, look up airports in a csv file instead of the database')
+    sub.add_argument('--zenith', default='civil')
+    sub.add_argument('--chunk-size', type=int, default=10000, help='rows per query when reading the database')
+    sub.set_defaults(func=export_columnar)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'recheck-night' and args.dry_run and not args.airport:
+        parser.error('recheck-night --dry-run needs airports, without them flights are only listed')
+    if args.command == 'export' and args.airports and not args.report:
+        parser.error('export --airports needs --report, database exports read airports from logbook_flights')
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(args.func, args)
+        finally:
+            profiler.dump_stats(args.profile)
+            print('Profile saved as ' + args.profile)
+    else:
+        result = args.func(args)
+
+    if args.stats or args.stats_json:
+        import pipeline_stats
+
+        if args.stats:
+            pipeline_stats.print_summary()
+        if args.stats_json:
+            pipeline_stats.write_json(args.stats_json)
+            print('Stats saved as ' + args.stats_json)
+    return result
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,9 +6,30 @@ a tuple containing a dictionary of flights and a dictionary of sims
 from __future__ import absolute_import
 from __future__ import print_function
 import datetime
+import time
+
+import pipeline_stats
+
+end_of_report_msg = 'End of report reached before the logbook totals'
+
 
 def process_ecrew_logbook_report(inFileName):
 
+    #open input files
+    print('Opening: ' + inFileName)
+    logbookFile = open(inFileName)
+    try:
+        return read_ecrew_logbook_report(logbookFile)
+    finally:
+        logbookFile.close()
+
+
+def read_ecrew_logbook_report(logbookFile):
+    """ reads a report from an open file or file-like object e.g. an uploaded report in a StringIO,
+        raises ValueError if the report ends before the logbook totals """
+
+    parse_start = time.perf_counter()
+
     #constants
 
     page_start_key = '<a'
@@ -18,10 +39,6 @@ def process_ecrew_logbook_report(inFileName):
     num_info_per_flight = 18 #update Sep 2019
     info_div_key = 'font-family' #divs with useful data in them, not just style boxes
 
-    #open input files
-    print('Opening: ' + inFileName)
-    logbookFile = open(inFileName)
-
     #
     flight_list = []
     sim_list = []
@@ -34,6 +51,8 @@ def process_ecrew_logbook_report(inFileName):
             line = logbookFile.readline()
             if page_start_key.lower() in line.lower():
                 break
+            if line == '':
+                raise ValueError(end_of_report_msg)
 
         #read through page header
         div_count = 0
@@ -41,6 +60,8 @@ def process_ecrew_logbook_report(inFileName):
             line = logbookFile.readline()
             if '<div' in line.lower():
                 div_count += 1
+            if line == '':
+                raise ValueError(end_of_report_msg)
 
         # cycle through flights in grouping
         flight_count = 0
@@ -50,7 +71,10 @@ def process_ecrew_logbook_report(inFileName):
             while entry_number < num_info_per_flight :
                 #read in an entire <div></div> and extract useful text
                 while '</div>' not in line:
-                    line += logbookFile.readline() #append lines until <div..>..</div> complete
+                    next_line = logbookFile.readline() #append lines until <div..>..</div> complete
+                    if next_line == '':
+                        raise ValueError(end_of_report_msg)
+                    line += next_line
                 if logbook_end_key.lower() in line.lower():
                     break
                 if info_div_key in line:
@@ -69,8 +93,6 @@ def process_ecrew_logbook_report(inFileName):
             flight_count += 1
         if logbook_end_key.lower() in line.lower():
                     break
-     
-    logbookFile.close()
 
     #process flight_list into dictionaries of flights and sims
     flight_dict=[]
@@ -104,8 +126,10 @@ def process_ecrew_logbook_report(inFileName):
                    'arr_time':arr_time,
                    'training_type':entry[15]}
             sim_dict.append(sim)
-                
-    logbookFile.close()
+
+    pipeline_stats.count('flights parsed', len(flight_dict))
+    pipeline_stats.count('sims parsed', len(sim_dict))
+    pipeline_stats.add_time('parse report', time.perf_counter() - parse_start)
     print("Finished")                   
     return (flight_dict,sim_dict)
 
@@ -0,0 +1,238 @@
+"""
+Long running HTTP service for importing eCrew logbook reports
+The database connection pool, airport and aircraft maps and the solar caches in each worker
+process stay warm between requests, so a month end of reports only pays start up once
+
+    POST /flights?zenith=civil          report .htm as the body, returns the enriched flights and sims
+    POST /import?pf=1,0,..&copilot=Name as /flights then inserts the flights into logbook_flights
+    POST /reload                        re-reads the airport and aircraft tables
+    GET  /status                        cache sizes and the pipeline_stats counters and timers,
+                                        including those from the worker processes
+
+pf lists PF (1) or PM (0) for each flight in report order, missing entries are PM. copilot is
+used for flights where the report gives Self as PIC.
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import ecrew_pilot_log
+import ecrew_sql
+import night_calc
+import pipeline_stats
+
+# largest report accepted, a year of flights is well under 1MB
+max_report_size = 16 * 1024 * 1024
+
+# reference data for the worker processes, set by init_worker
+worker_reference = None
+
+
+def init_worker(airports):
+    global worker_reference
+    worker_reference = ecrew_sql.ReferenceMaps(airports)
+
+
+def process_report(report_text, zenith='civil'):
+    """ runs in a worker process: parses a report and computes night time for each flight,
+        returns (flights, sims, night arrivals, missing airports, pipeline_stats for this report) """
+    pipeline_stats.reset()  # a worker runs one report at a time so the totals are this report's delta
+    flight_dict, sim_dict = ecrew_pilot_log.read_ecrew_logbook_report(io.StringIO(report_text))
+    ecrew_sql.strip_registrations(flight_dict)
+    missing_airports = ecrew_sql.missing_reference_data(worker_reference, flight_dict, False)[0]
+    if missing_airports:
+        return flight_dict, sim_dict, [], sorted(missing_airports), pipeline_stats.snapshot()
+    night_arrivals = [ecrew_sql.enrich_flight(flight, worker_reference, zenith) for flight in flight_dict]
+    return flight_dict, sim_dict, night_arrivals, [], pipeline_stats.snapshot()
+
+
+def json_value(value):
+    if hasattr(value, 'strftime'):
+        return value.strftime(ecrew_sql.dform)
+    if hasattr(value, 'total_seconds'):
+        return night_calc.td_hhmm(value)
+    return value
+
+
+def json_record(record):
+    return dict((key, json_value(value)) for key, value in record.items())
+
+
+class ImportService(object):
+    """
+    Warm state shared by the request handler threads. Pool checkouts are capped at the pool
+    size by a semaphore, as MySQLConnectionPool raises PoolError rather than waiting.
+    """
+
+    def __init__(self, workers=None, db_connections=5, pool=None):
+        """
+        @param pool: Anything with get_connection(), a MySQLConnectionPool from
+                     ecrew_sql_settings is opened if not given.
+        """
+        if pool is None:
+            import ecrew_sql_settings
+            import mysql.connector.pooling
+
+            pool = mysql.connector.pooling.MySQLConnectionPool(pool_name='ecrew_service',
+                                                               pool_size=db_connections,
+                                                               user=ecrew_sql_settings.DB_USER,
+                                                               password=ecrew_sql_settings.DB_PWD,
+                                                               host=ecrew_sql_settings.DB_HOST,
+                                                               port=ecrew_sql_settings.DB_PORT,
+                                                               database=ecrew_sql_settings.DB_DB)
+        self.pool = pool
+        self.workers = workers
+        self.executor = None
+        self.reference = None
+        self.lock = threading.Lock()
+        self.connections = threading.BoundedSemaphore(db_connections)
+        self.reload()
+
+    def reload(self):
+        """ re-reads the reference tables and restarts the workers with the new airports """
+        with self.connections:
+            cnx = self.pool.get_connection()
+            try:
+                reference = ecrew_sql.ReferenceMaps.load(cnx.cursor())
+            finally:
+                cnx.close()
+        # workers are started on the first submit from a handler thread, a forked child would
+        # inherit locks held by the other threads and the pool's sockets
+        executor = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=init_worker,
+                                                          initargs=(reference.airports,),
+                                                          mp_context=multiprocessing.get_context('forkserver'))
+        with self.lock:
+            old_executor, self.executor, self.reference = self.executor, executor, reference
+        if old_executor is not None:
+            # reports already submitted to the old workers finish before it stops
+            old_executor.shutdown(wait=True)
+
+    def enrich(self, report_text, zenith):
+        with pipeline_stats.timer('process report'):
+            # submit under the lock so reload cannot shut the executor down in between
+            with self.lock:
+                future, reference = self.executor.submit(process_report, report_text, zenith), self.reference
+            flight_dict, sim_dict, night_arrivals, missing_airports, worker_stats = future.result()
+        pipeline_stats.merge(worker_stats)
+        pipeline_stats.count('reports processed')
+        missing_aircraft = set()
+        for flight in flight_dict:
+            flight['aircraft'] = reference.aircraft_id(flight['reg'])
+            if flight['aircraft'] is None:
+                missing_aircraft.add(flight['reg'])
+        return flight_dict, sim_dict, night_arrivals, missing_airports, sorted(missing_aircraft)
+
+    def flights(self, report_text, params):
+        flight_dict, sim_dict, night_arrivals, missing_airports, missing_aircraft = \
+            self.enrich(report_text, params.get('zenith', 'civil'))
+        return 200, {'flights': [json_record(flight) for flight in flight_dict],
+                     'sims': [json_record(sim) for sim in sim_dict],
+                     'night_arrivals': night_arrivals,
+                     'missing_airports': missing_airports,
+                     'missing_aircraft': missing_aircraft}
+
+    def insert(self, report_text, params):
+        flight_dict, sim_dict, night_arrivals, missing_airports, missing_aircraft = \
+            self.enrich(report_text, params.get('zenith', 'civil'))
+        if missing_airports or missing_aircraft:
+            return 409, {'error': 'reference data missing from database',
+                         'missing_airports': missing_airports,
+                         'missing_aircraft': missing_aircraft}
+
+        pf = [value.strip() == '1' for value in params.get('pf', '').split(',')]
+        copilot_name = params.get('copilot', '')
+        for i, (flight, night_arrival) in enumerate(zip(flight_dict, night_arrivals)):
+            set_pf = pf[i] if i < len(pf) else False
+            flight_copilot = copilot_name if flight['name_pic'] == 'Self' else 'Self'
+            ecrew_sql.set_crew(flight, set_pf, flight_copilot, night_arrival)
+
+        with self.connections:
+            cnx = self.pool.get_connection()
+            try:
+                new_records, failures = ecrew_sql.insert_flights(cnx, flight_dict)
+            finally:
+                cnx.close()  # returns the connection to the pool
+        return 200, {'inserted': new_records, 'failures': failures,
+                     'flights': [json_record(flight) for flight in flight_dict]}
+
+    def status(self):
+        with self.lock:
+            reference = self.reference
+        return 200, {'airports': len(reference.airports), 'aircraft': len(reference.aircraft),
+                     'workers': self.workers, 'stats': pipeline_stats.snapshot()}
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    service = None  # set on the subclass made by serve
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/status':
+            self.respond(*self.service.status())
+        else:
+            self.respond(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        try:
+            if url.path == '/reload':
+                self.service.reload()
+                self.respond(*self.service.status())
+            elif url.path in ('/flights', '/import'):
+                length = int(self.headers.get('Content-Length', 0))
+                if length <= 0 or length > max_report_size:
+                    self.respond(413 if length else 411, {'error': 'report size must be 1 to %d bytes'
+                                                                   % max_report_size})
+                    return
+                report_text = self.rfile.read(length).decode('utf8', 'replace')
+                if url.path == '/flights':
+                    self.respond(*self.service.flights(report_text, params))
+                else:
+                    self.respond(*self.service.insert(report_text, params))
+            else:
+                self.respond(404, {'error': 'not found'})
+        except ValueError as e:
+            self.respond(400, {'error': str(e)})
+        except Exception as e:
+            self.respond(500, {'error': '%s: %s' % (type(e).__name__, e)})
+
+    def respond(self, code, body):
+        data = json.dumps(body).encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(host='127.0.0.1', port=8642, workers=None, db_connections=5):
+    service = ImportService(workers, db_connections)
+    handler = type('BoundServiceRequestHandler', (ServiceRequestHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    print('Serving eCrew imports on http://%s:%d' % (host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    serve()
@@ -2,122 +2,193 @@
 Function that takes an eCrew Pilot logbook report as an input and returns
 an sql file for importing into a logbook database
 Input file should be an ecrew logbook report that has been opened in a new window then saved as .htm
+mysql.connector and ecrew_sql_settings are only imported when a connection is opened so the
+parsing and night time functions can be used without a database
 """
 
 from __future__ import absolute_import
 from __future__ import print_function
 
-import ecrew_sql_settings
-import mysql.connector
+import csv
 
 import ecrew_pilot_log
 import night_calc
-
-# logbook format for datetime objects
-dform = '%Y-%m-%d %H:%M'
-
-print('Processing ecrew logbook report')
-
-file_name = input('Enter the input file name (e.g flights.htm): ')
-result = ecrew_pilot_log.process_ecrew_logbook_report(file_name)
-
-flight_dict = result[0]
-sim_dict = result[1]
-
-print(str(len(flight_dict)) + ' flights were successfully read')
-
-print('Opening database connection')
-cnx = mysql.connector.connect(user=ecrew_sql_settings.DB_USER,
-                              password=ecrew_sql_settings.DB_PWD,
-                              host=ecrew_sql_settings.DB_HOST,
-                              port=ecrew_sql_settings.DB_PORT,
-                              database=ecrew_sql_settings.DB_DB)
-cursor = cnx.cursor(raw=True)
-
-# Check that airports have already been entered into database
-missing_airports = set()
-
-for flight in flight_dict:
-    query = 'SELECT ICAO_code FROM logbook_airports WHERE IATA_code = %s'
-    data = (flight['dep_place'],)
-    # print query, data
-    cursor.execute(query, data)
-    dep_info = cursor.fetchone()
-    # print dep_info
-    if not dep_info:
-        missing_airports.add(flight['dep_place'])
-        continue
-
-for flight in flight_dict:
-    query = 'SELECT ICAO_code FROM logbook_airports WHERE IATA_code = %s'
-    data = (flight['arr_place'],)
-    cursor.execute(query, data)
-    dep_info = cursor.fetchone()
-    if not dep_info:
-        missing_airports.add(flight['arr_place'])
-        continue
-
-if len(missing_airports) > 0:
-    print('Following airports missing from database: (' + ', '.join(missing_airports) + ')')
-
-# Check that aircraft have already been entered into database
-missing_aircraft = set()
-
-for flight in flight_dict:
-    query = 'SELECT ID FROM logbook_aircraft WHERE Registration = %s'
-    flight['reg'] = flight['reg'].replace('-', '')  # Strip - from registration
-    data = (flight['reg'],)
-    cursor.execute(query, data)
-    ac_info = cursor.fetchone()
-
-    if not ac_info:
-        missing_aircraft.add(flight['reg'])
-        continue
-
-if len(missing_aircraft) > 0:
-    print('Following aircraft missing from database: (' + ', '.join(missing_aircraft) + ')')
-
-if len(missing_aircraft) > 0 or len(missing_airports) > 0:
-    exit()
-
-# Database is good to go!
-
-auto_pf = False
-
-copilot_name = ''
-for flight in flight_dict:
-    query = 'SELECT ICAO_code, Latitude, Longitude FROM logbook_airports WHERE IATA_code = %s'
-
-    # get departure airport information
-    data = (flight['dep_place'],)
-    cursor.execute(query, data)
-    dep_info = cursor.fetchone()  # tuple of (ICAO, lat, lon)
-
-    # get arrival airport information
-    data = (flight['arr_place'],)
-    cursor.execute(query, data)
-    arr_info = cursor.fetchone()  # tuple of (ICAO, lat, lon)
+import pipeline_stats
+import rolling_totals
+import sql_export
+
+dform = sql_export.dform
+
+airport_query = 'SELECT ICAO_code, Latitude, Longitude FROM logbook_airports WHERE IATA_code = %s'
+aircraft_query = 'SELECT ID FROM logbook_aircraft WHERE Registration = %s'
+aircraft_type_query = 'SELECT LT.Type FROM logbook_aircraft LA ' \
+                      'JOIN logbook_aircraft_type LT ON LT.ID = LA.Type WHERE LA.Registration = %s'
+
+
+def connect():
+    """ opens a connection using the parameters in ecrew_sql_settings """
+    import ecrew_sql_settings
+    import mysql.connector
+
+    return mysql.connector.connect(user=ecrew_sql_settings.DB_USER,
+                                   password=ecrew_sql_settings.DB_PWD,
+                                   host=ecrew_sql_settings.DB_HOST,
+                                   port=ecrew_sql_settings.DB_PORT,
+                                   database=ecrew_sql_settings.DB_DB)
+
+
+class ReferenceData(object):
+    """
+    Airport and aircraft lookups, each IATA code and registration is only queried once.
+    Airports are returned as a tuple of (ICAO, lat, lon), aircraft as the logbook ID and
+    aircraft types as the type name, None if missing from the database.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.airports = {}
+        self.aircraft = {}
+        self.aircraft_types = {}
+
+    def airport(self, iata_code):
+        if iata_code not in self.airports:
+            pipeline_stats.count('db round trips')
+            with pipeline_stats.timer('reference lookup'):
+                self.cursor.execute(airport_query, (iata_code,))
+                info = self.cursor.fetchone()
+            if info:
+                # mysql-connector-python imports ICAO as a bytearray so decode to string
+                info = (sql_export.field_text(info[0]), float(info[1]), float(info[2]))
+            self.airports[iata_code] = info
+        return self.airports[iata_code]
+
+    def aircraft_id(self, registration):
+        if registration not in self.aircraft:
+            pipeline_stats.count('db round trips')
+            with pipeline_stats.timer('reference lookup'):
+                self.cursor.execute(aircraft_query, (registration,))
+                info = self.cursor.fetchone()
+            self.aircraft[registration] = int(info[0]) if info else None
+        return self.aircraft[registration]
+
+    def aircraft_type(self, registration):
+        if registration not in self.aircraft_types:
+            pipeline_stats.count('db round trips')
+            with pipeline_stats.timer('reference lookup'):
+                self.cursor.execute(aircraft_type_query, (registration,))
+                info = self.cursor.fetchone()
+            self.aircraft_types[registration] = sql_export.field_text(info[0]) if info else None
+        return self.aircraft_types[registration]
+
+
+class ReferenceMaps(object):
+    """
+    Whole airport and aircraft tables held in memory for a long running process, with the
+    same lookups as ReferenceData. Call load again after the reference tables change.
+    """
+
+    def __init__(self, airports=None, aircraft=None, aircraft_types=None):
+        self.airports = airports or {}
+        self.aircraft = aircraft or {}
+        self.aircraft_types = aircraft_types or {}
+
+    @classmethod
+    def load(cls, cursor):
+        maps = cls()
+        with pipeline_stats.timer('reference load'):
+            pipeline_stats.count('db round trips')
+            cursor.execute('SELECT IATA_code, ICAO_code, Latitude, Longitude FROM logbook_airports '
+                           'WHERE IATA_code IS NOT NULL')
+            for iata_code, icao_code, lat, lon in cursor.fetchall():
+                maps.airports[sql_export.field_text(iata_code)] = (sql_export.field_text(icao_code),
+                                                                   float(lat), float(lon))
+            pipeline_stats.count('db round trips')
+            cursor.execute('SELECT LA.Registration, LA.ID, LT.Type FROM logbook_aircraft LA '
+                           'LEFT JOIN logbook_aircraft_type LT ON LT.ID = LA.Type')
+            for registration, aircraft_id, aircraft_type in cursor.fetchall():
+                registration = sql_export.field_text(registration)
+                maps.aircraft[registration] = int(aircraft_id)
+                if aircraft_type is not None:
+                    maps.aircraft_types[registration] = sql_export.field_text(aircraft_type)
+        return maps
+
+    def airport(self, iata_code):
+        return self.airports.get(iata_code)
+
+    def aircraft_id(self, registration):
+        return self.aircraft.get(registration)
+
+    def aircraft_type(self, registration):
+        return self.aircraft_types.get(registration)
+
+
+class AirportFile(object):
+    """
+    Airport lookups from a csv file of IATA,ICAO,Latitude,Longitude rows, used for dry runs
+    without a database. Aircraft and aircraft types are not looked up.
+    """
+
+    def __init__(self, file_name):
+        self.airports = {}
+        with open(file_name) as airport_file:
+            for row in csv.reader(airport_file):
+                if len(row) < 4 or row[0].strip().upper() == 'IATA':
+                    continue
+                self.airports[row[0].strip()] = (row[1].strip(), float(row[2]), float(row[3]))
+
+    def airport(self, iata_code):
+        return self.airports.get(iata_code)
+
+    def aircraft_id(self, registration):
+        return None
+
+    def aircraft_type(self, registration):
+        return None
+
+
+def strip_registrations(flight_dict):
+    for flight in flight_dict:
+        flight['reg'] = flight['reg'].replace('-', '')  # Strip - from registration
+
+
+def missing_reference_data(reference, flight_dict, check_aircraft=True):
+    """ returns sets of the airports and aircraft not yet entered into the database """
+    missing_airports = set()
+    missing_aircraft = set()
+    for flight in flight_dict:
+        for place in (flight['dep_place'], flight['arr_place']):
+            if not reference.airport(place):
+                missing_airports.add(place)
+        if check_aircraft and reference.aircraft_id(flight['reg']) is None:
+            missing_aircraft.add(flight['reg'])
+    return missing_airports, missing_aircraft
+
+
+def enrich_flight(flight, reference, zenith='civil'):
+    """ adds night_time, total_time, ICAO codes and aircraft number to a flight dictionary,
+        returns True if the arrival was at night """
+    dep_info = reference.airport(flight['dep_place'])  # tuple of (ICAO, lat, lon)
+    arr_info = reference.airport(flight['arr_place'])
 
     # include night_time field
-    night_time = night_calc.night_hours(flight['dep_time'], float(dep_info[1]), float(dep_info[2]),
-                                        flight['arr_time'], float(arr_info[1]), float(arr_info[2]),
-                                      'civil')
+    night_time = night_calc.night_hours(flight['dep_time'], dep_info[1], dep_info[2],
+                                        flight['arr_time'], arr_info[1], arr_info[2],
+                                        zenith)
 
     flight['night_time'] = night_time[1]
     flight['total_time'] = flight['arr_time'] - flight['dep_time']
 
     # include ICAO code
-    # mysql-connector-python imports ICAO as a bytearray so decode to string
-    flight['dep_ICAO'] = dep_info[0].decode('utf8')
-    flight['arr_ICAO'] = arr_info[0].decode('utf8')
+    flight['dep_ICAO'] = dep_info[0]
+    flight['arr_ICAO'] = arr_info[0]
 
     # look up aircraft number
-    query = 'SELECT ID FROM logbook_aircraft WHERE Registration = %s'
-    data = (flight['reg'],)
-    cursor.execute(query, data)
-    ac_info = cursor.fetchone()
-    flight['aircraft'] = int(ac_info[0])
+    flight['aircraft'] = reference.aircraft_id(flight['reg'])
+    return night_time[2]
+
 
+def prompt_crew(flight_dict, night_arrivals):
+    """ asks who was PF and the copilot name for each flight and sets the landing fields """
     # random PF - this method is broken now than name_pic is always Self
     # if auto_pf :
     #     if flight['name_pic'] != PIC :
@@ -129,109 +200,147 @@ for flight in flight_dict:
     #         P1 = abs(P1-1) #switch between 1 and 0
     #
     # else:
-    prompt = flight['dep_ICAO'] + ' ' + flight['arr_ICAO'] + ' ' + flight['dep_time'].strftime(dform) + ' ' + flight[
-        'arr_time'].strftime(dform) + ' ' + flight['name_pic'] + ' - PF? y(es)/n(o)> '
-    PF = ''
-    while PF != 'y' and PF != 'n':
-        PF = input(prompt)
-
-    if PF == 'y':
-        P1 = 1
-    else:
-        P1 = 0
-
-    # Check for a new copilot name or use last entered
-    if flight['name_pic'] == 'Self':
-        prompt = 'Copilot Name: (' + copilot_name + ') '
-        new_copilot_name = input(prompt)
-        if new_copilot_name != '':
-            copilot_name = new_copilot_name
-    else:
-        copilot_name = 'Self'
-
-    # Check for comments
-    # prompt = 'Comments: (-) '
-    # comments = raw_input(prompt)
-    # if comments == '': comments = '-'
-    flight['comments'] = '-'  # comments
+    copilot_name = ''
+    for flight, night_arrival in zip(flight_dict, night_arrivals):
+        prompt = flight['dep_ICAO'] + ' ' + flight['arr_ICAO'] + ' ' + flight['dep_time'].strftime(dform) + ' ' + \
+            flight['arr_time'].strftime(dform) + ' ' + flight['name_pic'] + ' - PF? y(es)/n(o)> '
+        PF = ''
+        while PF != 'y' and PF != 'n':
+            PF = input(prompt)
+
+        # Check for a new copilot name or use last entered
+        if flight['name_pic'] == 'Self':
+            prompt = 'Copilot Name: (' + copilot_name + ') '
+            new_copilot_name = input(prompt)
+            if new_copilot_name != '':
+                copilot_name = new_copilot_name
+        else:
+            copilot_name = 'Self'
+
+        set_crew(flight, PF == 'y', copilot_name, night_arrival)
 
+
+def set_crew(flight, pf, copilot_name, night_arrival, comments='-'):
+    flight['comments'] = comments
     flight['name_copilot'] = copilot_name
-    flight['PF'] = P1
+    flight['PF'] = 1 if pf else 0
     flight['ldg_day'] = 0
     flight['ldg_ngt'] = 0
-    if P1:
-        if night_time[2]:  # night arrival
+    if pf:
+        if night_arrival:
             flight['ldg_ngt'] = 1
         else:
             flight['ldg_day'] = 1
 
-prompt = 'Would you like to automatically insert ' + str(len(flight_dict)) + ' new records? (y/N)'
-response = input(prompt)
-insert_records = (response == 'y' or response == 'Y')
-
-output_file_name = 'new_flights.sql'
-output_file = open(output_file_name, mode='w')
-
-new_records = 0
-failures = 0
-
-for flight in flight_dict:
-
-    # Create database sql insert statement
-    if flight['name_pic'] == 'Self':
-        columns = (
-            'Dep_Place', 'Arr_Place', 'Dep_Time', 'Arr_Time', 'Aircraft', 'PF', 'Name_PIC', 'Name_Copilot',
-            'Night_Time',
-            'Can_P1_XC_Night', 'IFR_Time', 'PIC_Time', 'Can_P1', 'Can_P1_XC', 'Function', 'Ldg_Day', 'Ldg_Night',
-            'Comments')
-
-        values = (
-            flight['dep_ICAO'], flight['arr_ICAO'], flight['dep_time'].strftime(dform),
-            flight['arr_time'].strftime(dform),
-            flight['aircraft'], flight['PF'], flight['name_pic'], flight['name_copilot'], str(flight['night_time']),
-            str(flight['night_time']), str(flight['total_time']), str(flight['total_time']), str(flight['total_time']),
-            str(flight['total_time']), 'P1', flight['ldg_day'], flight['ldg_ngt'], flight['comments'])
-
-        if flight['instr']:  # Instructor time
-            columns += ('Instr_Time',)
-            values += (str(flight['total_time']),)
-
-    else:
-        columns = (
-            'Dep_Place', 'Arr_Place', 'Dep_Time', 'Arr_Time', 'Aircraft', 'PF', 'Name_PIC', 'Name_Copilot',
-            'Night_Time',
-            'IFR_Time', 'Copilot_Time', 'Function', 'Ldg_Day', 'Ldg_Night', 'Comments')
-
-        values = (
-            flight['dep_ICAO'], flight['arr_ICAO'], flight['dep_time'].strftime(dform),
-            flight['arr_time'].strftime(dform),
-            flight['aircraft'], flight['PF'], flight['name_pic'], flight['name_copilot'], str(flight['night_time']),
-            str(flight['total_time']), str(flight['total_time']), 'FO', flight['ldg_day'], flight['ldg_ngt'],
-            flight['comments'])
-
-    qry_txt = 'INSERT INTO logbook_flights ('
-    for col in columns:
-        qry_txt += '`' + col + '`, '
-    qry_txt = qry_txt[:-2]
-    qry_txt += ') VALUES '
-    qry_txt += str(values)
-    query = qry_txt
+
+def insert_flights(cnx, flight_dict):
+    """ inserts the flights one transaction each, so a duplicate only fails its own row,
+        returns (new records, failures) """
+    import mysql.connector
+
+    new_records = 0
+    failures = 0
+
+    cursor = cnx.cursor()
+    if rolling_totals.ensure_table(cursor):
+        print('Daily totals back-filled from logbook_flights')
+    pipeline_stats.count('db round trips')
+    cnx.commit()
+
+    for flight in flight_dict:
+        columns, values = sql_export.flight_record(flight)
+
+        with pipeline_stats.timer('insert flight'):
+            try:
+                pipeline_stats.count('db round trips')
+                cursor.execute(sql_export.insert_query(columns), values)
+                # keep the daily summary rows in the same transaction as the flight
+                rolling_totals.add_flights(cursor, [flight])
+                pipeline_stats.count('db round trips')
+                cnx.commit()
+                new_records += 1
+            except mysql.connector.Error:
+                pipeline_stats.count('db round trips')
+                cnx.rollback()
+                failures += 1
+
+    cursor.close()
+    return new_records, failures
+
+
+def export_flights(flight_dict, export_format, output_file_name, cnx=None):
+    """ writes the flights to output_file_name and inserts them if a connection is given,
+        returns (writer, new records, failures) """
+    with pipeline_stats.timer('write sql file'):
+        output_writer = sql_export.open_writer(export_format, output_file_name)
+        for flight in flight_dict:
+            # Create database sql insert statement and the matching daily totals
+            output_writer.write_flight(flight)
+        output_writer.close()
+
+    new_records = 0
+    failures = 0
+    if cnx is not None:
+        new_records, failures = insert_flights(cnx, flight_dict)
+    return output_writer, new_records, failures
+
+
+def main(file_name=None, export_format=None, output_file_name='new_flights.sql', zenith='civil'):
+    print('Processing ecrew logbook report')
+
+    if file_name is None:
+        file_name = input('Enter the input file name (e.g flights.htm): ')
+    flight_dict, sim_dict = ecrew_pilot_log.process_ecrew_logbook_report(file_name)
+    strip_registrations(flight_dict)
+
+    print(str(len(flight_dict)) + ' flights were successfully read')
+
+    print('Opening database connection')
+    cnx = connect()
+    cursor = cnx.cursor(raw=True)
+    reference = ReferenceData(cursor)
+
+    # Check that airports and aircraft have already been entered into database
+    missing_airports, missing_aircraft = missing_reference_data(reference, flight_dict)
+
+    if len(missing_airports) > 0:
+        print('Following airports missing from database: (' + ', '.join(missing_airports) + ')')
+
+    if len(missing_aircraft) > 0:
+        print('Following aircraft missing from database: (' + ', '.join(missing_aircraft) + ')')
+
+    if len(missing_aircraft) > 0 or len(missing_airports) > 0:
+        cnx.close()
+        return 1
+
+    # Database is good to go!
+    night_arrivals = [enrich_flight(flight, reference, zenith) for flight in flight_dict]
+    prompt_crew(flight_dict, night_arrivals)
+
+    prompt = 'Would you like to automatically insert ' + str(len(flight_dict)) + ' new records? (y/N)'
+    response = input(prompt)
+    insert_records = (response == 'y' or response == 'Y')
+
+    # multi-row INSERT statements or a data file plus LOAD DATA script for bulk loading
+    while export_format not in sql_export.export_formats:
+        export_format = input('Output format - ' + '/'.join(sql_export.export_formats) + ' (insert)> ') or 'insert'
+
+    output_writer, new_records, failures = export_flights(flight_dict, export_format, output_file_name,
+                                                          cnx if insert_records else None)
 
     if insert_records:
-        try:
-            cursor.execute(query)
-            cnx.commit()
-            new_records += 1
-        except:
-            failures += 1
+        print('Successfully inserted ' + str(new_records) + ' records with ' + str(failures) + ' failures')
+        if new_records:
+            rolling_totals.print_ftl_totals(cnx.cursor(), max(flight['dep_time'] for flight in flight_dict).date())
 
-    output_file.write(qry_txt + ';\n')
+    print('SQL file successfully saved as ' + output_file_name)
+    if export_format != 'insert':
+        print('Load data files: ' + ', '.join(output_writer.data_file_names))
 
-if insert_records:
-    print('Successfully inserted ' + str(new_records) + ' records with ' + str(failures) + ' failures')
+    print('Closing database connection')
+    cnx.close()
+    return 0
 
-output_file.close()
-print('SQL file successfully saved as ' + output_file_name)
 
-print('Closing database connection')
-cnx.close()
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,292 @@
+"""
+Expected logbook database schema and the indexes the lookup queries rely on
+A live database can be checked against the declaration and missing indexes applied as a migration
+Usage: logbook_schema.py check | migrate | benchmark [--seed N]
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import datetime
+import random
+import time
+
+import rolling_totals
+
+# table name -> ((column, definition), ...) for the columns the tools read or write
+tables = (
+    ('logbook_airports', (
+        ('ID', 'INT NOT NULL AUTO_INCREMENT PRIMARY KEY'),
+        ('ICAO_Code', 'CHAR(4) NOT NULL'),
+        ('IATA_code', 'CHAR(3)'),
+        ('Latitude', 'DECIMAL(9,6) NOT NULL'),
+        ('Longitude', 'DECIMAL(9,6) NOT NULL'))),
+    ('logbook_aircraft_type', (
+        ('ID', 'INT NOT NULL AUTO_INCREMENT PRIMARY KEY'),
+        ('Type', 'VARCHAR(32) NOT NULL'),
+        ('Turbine', 'TINYINT NOT NULL DEFAULT 0'))),
+    ('logbook_aircraft', (
+        ('ID', 'INT NOT NULL AUTO_INCREMENT PRIMARY KEY'),
+        ('Registration', 'VARCHAR(16) NOT NULL'),
+        ('Type', 'INT NOT NULL'))),
+    ('logbook_flights', (
+        ('ID', 'INT NOT NULL AUTO_INCREMENT PRIMARY KEY'),
+        ('Dep_Place', 'CHAR(4) NOT NULL'),
+        ('Arr_Place', 'CHAR(4) NOT NULL'),
+        ('Dep_Time', 'DATETIME NOT NULL'),
+        ('Arr_Time', 'DATETIME NOT NULL'),
+        ('Aircraft', 'INT NOT NULL'),
+        ('PF', 'TINYINT NOT NULL DEFAULT 0'),
+        ('Name_PIC', 'VARCHAR(64)'),
+        ('Name_Copilot', 'VARCHAR(64)'),
+        ('Night_Time', 'TIME'),
+        ('Can_P1_XC_Night', 'TIME'),
+        ('IFR_Time', 'TIME'),
+        ('PIC_Time', 'TIME'),
+        ('Can_P1', 'TIME'),
+        ('Can_P1_XC', 'TIME'),
+        ('Copilot_Time', 'TIME'),
+        ('Instr_Time', 'TIME'),
+        ('Function', 'VARCHAR(8)'),
+        ('Ldg_Day', 'INT NOT NULL DEFAULT 0'),
+        ('Ldg_Night', 'INT NOT NULL DEFAULT 0'),
+        ('Comments', 'VARCHAR(255)'))),
+)
+
+# (table, index name, columns, unique) - lookup columns first, then the columns the query
+# reads so the lookups are answered from the index alone
+indexes = (
+    ('logbook_airports', 'idx_airports_iata', ('IATA_code', 'ICAO_Code', 'Latitude', 'Longitude'), False),
+    ('logbook_airports', 'idx_airports_icao', ('ICAO_Code', 'Latitude', 'Longitude'), False),
+    ('logbook_aircraft', 'idx_aircraft_registration', ('Registration', 'ID'), False),
+    ('logbook_aircraft', 'idx_aircraft_type', ('Type', 'ID'), False),
+    ('logbook_aircraft_type', 'idx_aircraft_type_turbine', ('Turbine', 'ID'), False),
+    ('logbook_flights', 'idx_flights_aircraft', ('Aircraft',), False),
+    ('logbook_flights', 'idx_flights_dep_place', ('Dep_Place',), False),
+    ('logbook_flights', 'idx_flights_arr_place', ('Arr_Place',), False),
+    # a pilot cannot depart from the same place twice at the same time, so this identifies
+    # a flight and rejects duplicate imports
+    ('logbook_flights', 'uq_flights_identity', ('Dep_Time', 'Dep_Place'), True),
+)
+
+# the turbine flight join from night_hour_checker.py
+night_check_query = 'SELECT F.ID, F.Dep_Time, D.Latitude, D.Longitude, F.Arr_Time, A.Latitude, A.Longitude, ' \
+                    'F.Night_Time, LT.Type, LT.Turbine FROM logbook_flights F ' \
+                    'JOIN logbook_airports D ON D.ICAO_Code = F.Dep_Place ' \
+                    'JOIN logbook_airports A ON A.ICAO_Code = F.Arr_Place ' \
+                    'JOIN logbook_aircraft LA ON LA.ID = F.Aircraft ' \
+                    'JOIN logbook_aircraft_type LT ON LT.ID = LA.Type ' \
+                    'WHERE LT.Turbine = 1'
+
+
+def create_table_query(table, columns):
+    return 'CREATE TABLE IF NOT EXISTS ' + table + ' (' + \
+           ', '.join('`' + column + '` ' + definition for column, definition in columns) + ')'
+
+
+def create_tables(cursor):
+    """ creates any missing tables without their secondary indexes """
+    for table, columns in tables:
+        cursor.execute(create_table_query(table, columns))
+    cursor.execute(rolling_totals.create_table)
+
+
+def live_indexes(cursor):
+    """ returns a dictionary of table -> list of (columns, unique) for the current database """
+    cursor.execute('SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS '
+                   'WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX')
+    found = {}
+    for table, index_name, non_unique, column in cursor.fetchall():
+        table, index_name, column = [decode(value) for value in (table, index_name, column)]
+        found.setdefault((table.lower(), index_name), [int(non_unique) == 0, []])[1].append(column.lower())
+    result = {}
+    for (table, index_name), (unique, columns) in found.items():
+        result.setdefault(table, []).append((tuple(columns), unique))
+    return result
+
+
+def live_columns(cursor):
+    """ returns a dictionary of table -> set of column names for the current database """
+    cursor.execute('SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()')
+    result = {}
+    for table, column in cursor.fetchall():
+        result.setdefault(decode(table).lower(), set()).add(decode(column).lower())
+    return result
+
+
+def decode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf8')
+    return value
+
+
+def index_satisfied(existing, columns, unique):
+    """ an existing index covers the declared one if the declared columns are a prefix of it,
+        a unique index must match its columns exactly """
+    columns = tuple(column.lower() for column in columns)
+    for existing_columns, existing_unique in existing:
+        if unique:
+            if existing_unique and existing_columns == columns:
+                return True
+        elif existing_columns[:len(columns)] == columns:
+            return True
+    return False
+
+
+def check(cursor):
+    """ returns (missing tables, missing columns as (table, column), missing indexes as entries of indexes) """
+    columns_found = live_columns(cursor)
+    indexes_found = live_indexes(cursor)
+    missing_tables = []
+    missing_columns = []
+    for table, columns in tables:
+        if table not in columns_found:
+            missing_tables.append(table)
+            continue
+        for column, definition in columns:
+            if column.lower() not in columns_found[table]:
+                missing_columns.append((table, column))
+    missing_indexes = [index for index in indexes
+                       if index[0] not in missing_tables
+                       and not index_satisfied(indexes_found.get(index[0], []), index[2], index[3])]
+    return missing_tables, missing_columns, missing_indexes
+
+
+def duplicates(cursor, table, columns, limit=10):
+    """ returns up to limit groups of rows that would violate a unique index on columns """
+    column_text = ', '.join('`' + column + '`' for column in columns)
+    cursor.execute('SELECT ' + column_text + ', COUNT(*) FROM ' + table + ' GROUP BY ' + column_text +
+                   ' HAVING COUNT(*) > 1 LIMIT ' + str(int(limit)))
+    return cursor.fetchall()
+
+
+def migrate(cursor):
+    """ adds the missing indexes, one ALTER TABLE per table, a unique index is skipped while
+        duplicate rows exist; returns (applied indexes, skipped (index, duplicate rows)) """
+    missing_tables, missing_columns, missing_indexes = check(cursor)
+    applied = []
+    skipped = []
+    by_table = {}
+    for index in missing_indexes:
+        table, name, columns, unique = index
+        if unique:
+            found = duplicates(cursor, table, columns)
+            if found:
+                skipped.append((index, found))
+                continue
+        by_table.setdefault(table, []).append(index)
+
+    for table, table_indexes in by_table.items():
+        cursor.execute('ALTER TABLE ' + table + ' ' + ', '.join(
+            'ADD ' + ('UNIQUE ' if unique else '') + 'INDEX `' + name + '` (' +
+            ', '.join('`' + column + '`' for column in columns) + ')'
+            for table_, name, columns, unique in table_indexes))
+        applied.extend(table_indexes)
+    return applied, skipped
+
+
+def seed(cursor, num_flights, num_airports=400, num_aircraft=60):
+    """ fills an empty local database with random reference data and turbine flights for benchmarking """
+    create_tables(cursor)
+    rnd = random.Random(0)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    airports = []
+    for i in range(num_airports):
+        icao = 'E' + letters[i // 676 % 26] + letters[i // 26 % 26] + letters[i % 26]
+        airports.append((icao, icao[1:], round(rnd.uniform(-60, 60), 6), round(rnd.uniform(-180, 180), 6)))
+    cursor.executemany('INSERT INTO logbook_airports (ICAO_Code, IATA_code, Latitude, Longitude) '
+                       'VALUES (%s, %s, %s, %s)', airports)
+    cursor.executemany('INSERT INTO logbook_aircraft_type (Type, Turbine) VALUES (%s, %s)',
+                       [('A320', 1), ('PA28', 0)])
+    cursor.execute('SELECT MIN(ID) FROM logbook_aircraft_type')
+    first_type = cursor.fetchone()[0]
+    cursor.executemany('INSERT INTO logbook_aircraft (Registration, Type) VALUES (%s, %s)',
+                       [('EI' + letters[i // 26 % 26] + letters[i % 26] + 'X', first_type + (i % 10 == 0))
+                        for i in range(num_aircraft)])
+    cursor.execute('SELECT MIN(ID) FROM logbook_aircraft')
+    first_aircraft = cursor.fetchone()[0]
+
+    start = datetime.datetime(2010, 1, 1)
+    flights = []
+    for i in range(num_flights):
+        dep_time = start + datetime.timedelta(minutes=i * 397)
+        dep, arr = rnd.sample(airports, 2)
+        flights.append((dep[0], arr[0], dep_time, dep_time + datetime.timedelta(minutes=rnd.randint(40, 300)),
+                        first_aircraft + rnd.randrange(num_aircraft)))
+        if len(flights) == 1000:
+            cursor.executemany('INSERT INTO logbook_flights (Dep_Place, Arr_Place, Dep_Time, Arr_Time, Aircraft) '
+                               'VALUES (%s, %s, %s, %s, %s)', flights)
+            flights = []
+    if flights:
+        cursor.executemany('INSERT INTO logbook_flights (Dep_Place, Arr_Place, Dep_Time, Arr_Time, Aircraft) '
+                           'VALUES (%s, %s, %s, %s, %s)', flights)
+
+
+def time_query(cursor, query, repeat=3):
+    """ returns (best time in seconds, rows) for fetching every row of query """
+    best = None
+    rows = 0
+    for i in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(query)
+        rows = len(cursor.fetchall())
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, rows
+
+
+def print_check(cursor):
+    missing_tables, missing_columns, missing_indexes = check(cursor)
+    for table in missing_tables:
+        print('Missing table: ' + table)
+    for table, column in missing_columns:
+        print('Missing column: ' + table + '.' + column)
+    for table, name, columns, unique in missing_indexes:
+        print('Missing ' + ('unique ' if unique else '') + 'index: ' + table + '.' + name + ' (' +
+              ', '.join(columns) + ')')
+    if not (missing_tables or missing_columns or missing_indexes):
+        print('Schema is up to date')
+    return missing_tables, missing_columns, missing_indexes
+
+
+def print_migrate(cursor):
+    applied, skipped = migrate(cursor)
+    for table, name, columns, unique in applied:
+        print('Added index: ' + table + '.' + name)
+    for (table, name, columns, unique), found in skipped:
+        print('Skipped unique index ' + table + '.' + name + ', duplicate rows exist e.g. ' + str(found[0]))
+    print(str(len(applied)) + ' indexes added')
+
+
+if __name__ == '__main__':
+    import ecrew_sql
+
+    parser = argparse.ArgumentParser(description='Check and migrate the logbook database schema')
+    parser.add_argument('command', choices=('check', 'migrate', 'benchmark'))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='benchmark only: seed an empty local database with this many flights first')
+    args = parser.parse_args()
+
+    print('Opening database connection')
+    cnx = ecrew_sql.connect()
+    cursor = cnx.cursor(buffered=True)
+
+    if args.command == 'check':
+        print_check(cursor)
+    elif args.command == 'migrate':
+        print_migrate(cursor)
+    else:
+        if args.seed:
+            print('Seeding ' + str(args.seed) + ' flights')
+            seed(cursor, args.seed)
+            cnx.commit()
+        before, rows = time_query(cursor, night_check_query)
+        print('Night check join before migration: %.3fs (%d rows)' % (before, rows))
+        print_migrate(cursor)
+        after, rows = time_query(cursor, night_check_query)
+        print('Night check join after migration: %.3fs (%d rows)' % (after, rows))
+
+    print('Closing database connection')
+    cnx.close()
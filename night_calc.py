@@ -1,12 +1,19 @@
 import datetime
+import time
+
+import pipeline_stats
 from sunrisesunset import SunriseSunset
 
+# sunrisesunset is kept free of project imports, its counts are collected through this hook
+SunriseSunset.stats = pipeline_stats.count
+
 
 def night_hours(dep_datetime, dep_lat, dep_lon, arr_datetime, arr_lat, arr_lon, zenith='civil'):
     """ routine to calculate the night hours on a flight from one location to
         another, returns datetime.timedelta for day and night hours and a boolean to say
         if the landing (arrival) occurred at night """
 
+    start = time.perf_counter()
     one_day = datetime.timedelta(days=1)
 
     if dep_datetime.tzinfo is None:
@@ -105,6 +112,7 @@ def night_hours(dep_datetime, dep_lat, dep_lon, arr_datetime, arr_lat, arr_lon,
             td_night = hhmm_td(td_hhmm(tdttp1))
             td_day = tp2 - tp1 - td_night
 
+    pipeline_stats.add_time('night_hours', time.perf_counter() - start)
     return td_day, td_night, is_night_arr
 
 
@@ -0,0 +1,123 @@
+"""
+Targeted recalculation of Night_Time when airport reference data changes
+Every flight that used the corrected airports (or only turbine flights with --turbine-only)
+is found through the Dep_Place and Arr_Place indexes, then night_calc.night_hours is re-run
+on just those flights and the changes are written back in batches
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import argparse
+import datetime
+
+import night_calc
+import pipeline_stats
+import rolling_totals
+
+# a UNION so each half uses the idx_flights_dep_place / idx_flights_arr_place indexes
+# from logbook_schema, Night_Time is stored for every imported flight so all are affected
+affected_query = 'SELECT F.ID FROM logbook_flights F WHERE F.{column} IN ({places})'
+
+# the subset of flights night_hour_checker.py looks at
+affected_turbine_query = 'SELECT F.ID FROM logbook_flights F ' \
+                         'JOIN logbook_aircraft LA ON LA.ID = F.Aircraft ' \
+                         'JOIN logbook_aircraft_type LT ON LT.ID = LA.Type ' \
+                         'WHERE F.{column} IN ({places}) AND LT.Turbine = 1'
+
+flight_query = 'SELECT F.ID, F.Dep_Time, D.Latitude, D.Longitude, F.Arr_Time, A.Latitude, A.Longitude, ' \
+               'F.Night_Time, F.Ldg_Day, F.Ldg_Night FROM logbook_flights F ' \
+               'JOIN logbook_airports D ON D.ICAO_Code = F.Dep_Place ' \
+               'JOIN logbook_airports A ON A.ICAO_Code = F.Arr_Place ' \
+               'WHERE F.ID IN (%s)'
+
+# Can_P1_XC_Night is assigned first so it is compared against the old Night_Time
+update_query = 'UPDATE logbook_flights SET ' \
+               'Can_P1_XC_Night = IF(Can_P1_XC_Night = Night_Time, %s, Can_P1_XC_Night), ' \
+               'Night_Time = %s, Ldg_Day = %s, Ldg_Night = %s WHERE ID = %s'
+
+batch_size = 500
+
+
+def affected_flights(cursor, airports, turbine_only=False):
+    """ returns the sorted ids of flights departing from or arriving at any of the airports """
+    places = ', '.join(['%s'] * len(airports))
+    template = affected_turbine_query if turbine_only else affected_query
+    query = template.format(column='Dep_Place', places=places) + ' UNION ' + \
+        template.format(column='Arr_Place', places=places)
+    pipeline_stats.count('db round trips')
+    cursor.execute(query, tuple(airports) * 2)
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def recompute(cursor, flight_ids, zenith='civil', apply_changes=True):
+    """ re-runs night_hours for the given flights and batch updates those that changed,
+        returns a list of (flight id, old night time, new night time), the caller commits """
+    changes = []
+    updates = []
+    day_deltas = {}
+    for start in range(0, len(flight_ids), batch_size):
+        batch = flight_ids[start:start + batch_size]
+        pipeline_stats.count('db round trips')
+        with pipeline_stats.timer('fetch batch'):
+            cursor.execute(flight_query % ', '.join(['%s'] * len(batch)), tuple(batch))
+            rows = cursor.fetchall()
+        for flight in rows:
+            night = night_calc.night_hours(flight[1], float(flight[2]), float(flight[3]),
+                                           flight[4], float(flight[5]), float(flight[6]), zenith)
+            night_time = night_calc.hhmm_td(night_calc.td_hhmm(night[1]))  # logbook stores whole minutes
+            ldg_day, ldg_ngt = flight[8] or 0, flight[9] or 0
+            if ldg_day or ldg_ngt:
+                # the landing may have moved across sunrise or sunset
+                ldg_day, ldg_ngt = (0, ldg_day + ldg_ngt) if night[2] else (ldg_day + ldg_ngt, 0)
+            if night_time == flight[7] and ldg_day == (flight[8] or 0):
+                continue
+
+            changes.append((flight[0], flight[7], night_time))
+            updates.append((night_time, night_time, ldg_day, ldg_ngt, flight[0]))
+            delta = (0, 0, int((night_time - (flight[7] or datetime.timedelta(0))).total_seconds()), 0, 0,
+                     ldg_day - (flight[8] or 0), ldg_ngt - (flight[9] or 0))
+            day = flight[1].date()
+            day_deltas[day] = tuple(a + b for a, b in zip(day_deltas.get(day, (0,) * len(delta)), delta))
+
+    if apply_changes and updates:
+        # DDL commits implicitly so create (and back-fill) the summary table before any updates
+        rolling_totals.ensure_table(cursor)
+        for start in range(0, len(updates), batch_size):
+            pipeline_stats.count('db round trips')
+            with pipeline_stats.timer('update batch'):
+                cursor.executemany(update_query, updates[start:start + batch_size])
+        rolling_totals.add_day_totals(cursor, day_deltas)
+
+    return changes
+
+
+def main(airports, zenith='civil', dry_run=False, turbine_only=False):
+    import ecrew_sql
+
+    print('Opening database connection')
+    cnx = ecrew_sql.connect()
+    cursor = cnx.cursor(buffered=True)
+
+    flight_ids = affected_flights(cursor, [airport.upper() for airport in airports], turbine_only)
+    print(str(len(flight_ids)) + ' flights use ' + ', '.join(airports))
+
+    changes = recompute(cursor, flight_ids, zenith, not dry_run)
+    for flight_id, old_night, new_night in changes:
+        print(flight_id, night_calc.td_hhmm(old_night or datetime.timedelta(0)), night_calc.td_hhmm(new_night))
+    if not dry_run:
+        pipeline_stats.count('db round trips')
+        cnx.commit()
+    print(str(len(changes)) + (' flights to update' if dry_run else ' flights updated'))
+    print('Closing database connection')
+    cnx.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalculate night time for flights using corrected airports')
+    parser.add_argument('airports', nargs='+', help='ICAO codes of the corrected airports')
+    parser.add_argument('--zenith', default='civil')
+    parser.add_argument('--dry-run', action='store_true', help='list changes without updating the database')
+    parser.add_argument('--turbine-only', action='store_true', help='only flights in turbine aircraft')
+    args = parser.parse_args()
+    main(args.airports, args.zenith, args.dry_run, args.turbine_only)
@@ -0,0 +1,97 @@
+"""
+Counters and timers for each stage of an import
+Stages record into module level totals which can be printed as a summary or written as JSON
+Updates are made under a lock so handler threads in the import service do not lose counts,
+totals from worker processes are folded in with merge
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import contextlib
+import json
+import threading
+import time
+
+counters = {}  # name -> count
+timers = {}  # name -> [calls, total seconds, longest call seconds]
+lock = threading.Lock()
+
+
+def count(name, amount=1):
+    with lock:
+        counters[name] = counters.get(name, 0) + amount
+
+
+def add_time(name, seconds, calls=1, longest=None):
+    if longest is None:
+        longest = seconds
+    with lock:
+        entry = timers.get(name)
+        if entry is None:
+            timers[name] = [calls, seconds, longest]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+            if longest > entry[2]:
+                entry[2] = longest
+
+
+@contextlib.contextmanager
+def timer(name):
+    """ times the enclosed block, nested timers are each recorded in full """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+
+def reset():
+    with lock:
+        counters.clear()
+        timers.clear()
+
+
+def snapshot():
+    """ returns the current totals as a dictionary suitable for JSON """
+    with lock:
+        return {'counters': dict(counters),
+                'timers': dict((name, {'calls': calls, 'total': total, 'mean': total / calls, 'max': longest})
+                               for name, (calls, total, longest) in timers.items())}
+
+
+def merge(other):
+    """ adds the totals from a snapshot, e.g. one returned by a worker process """
+    for name, amount in other['counters'].items():
+        count(name, amount)
+    for name, timing in other['timers'].items():
+        add_time(name, timing['total'], timing['calls'], timing['max'])
+
+
+def summary():
+    """ returns the totals as a list of report lines """
+    stats = snapshot()
+    timers_ = dict((name, (timing['calls'], timing['total'], timing['max']))
+                   for name, timing in stats['timers'].items())
+    counters_ = stats['counters']
+    lines = []
+    if timers_:
+        lines.append('Stage'.ljust(32) + 'calls'.rjust(10) + 'total s'.rjust(12) + 'mean ms'.rjust(12)
+                     + 'max ms'.rjust(12))
+        for name, (calls, total, longest) in sorted(timers_.items(), key=lambda item: -item[1][1]):
+            lines.append(name.ljust(32) + str(calls).rjust(10) + ('%.3f' % total).rjust(12)
+                         + ('%.3f' % (1000 * total / calls)).rjust(12) + ('%.3f' % (1000 * longest)).rjust(12))
+    for name in sorted(counters_):
+        lines.append(name.ljust(32) + str(counters_[name]).rjust(10))
+    return lines
+
+
+def print_summary():
+    for line in summary():
+        print(line)
+
+
+def write_json(file_name):
+    with open(file_name, 'w') as json_file:
+        json.dump(snapshot(), json_file, indent=2, sort_keys=True)
@@ -0,0 +1,241 @@
+"""
+Rolling flight time totals for flight time limitation checks
+Per-day summary rows in logbook_daily_totals are updated incrementally as flights are
+imported, rolling windows are answered from prefix sums over the summary rows so a query
+only reads the days in its window regardless of the size of logbook_flights
+Flights are counted on the UTC day they depart
+The sql_export scripts carry the same upserts, flights loaded any other way leave the
+summary behind, which check detects and rebuild repairs
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import datetime
+import sys
+
+import pipeline_stats
+
+# summary columns, times are stored in seconds
+fields = ('Sectors', 'Total_Time', 'Night_Time', 'PIC_Time', 'Copilot_Time', 'Ldg_Day', 'Ldg_Night')
+time_fields = ('Total_Time', 'Night_Time', 'PIC_Time', 'Copilot_Time')
+
+create_table = 'CREATE TABLE IF NOT EXISTS logbook_daily_totals (' \
+               '`Day` DATE NOT NULL PRIMARY KEY, ' + \
+               ', '.join('`' + field + '` INT NOT NULL DEFAULT 0' for field in fields) + ')'
+
+add_query = 'INSERT INTO logbook_daily_totals (`Day`, ' + ', '.join('`' + field + '`' for field in fields) + \
+            ') VALUES (' + ', '.join(['%s'] * (len(fields) + 1)) + ') ON DUPLICATE KEY UPDATE ' + \
+            ', '.join('`' + field + '` = `' + field + '` + VALUES(`' + field + '`)' for field in fields)
+
+# full rebuild from logbook_flights, only needed once to back-fill an existing logbook
+rebuild_select = 'INSERT INTO logbook_daily_totals (`Day`, ' + ', '.join('`' + field + '`' for field in fields) + \
+                 ') SELECT DATE(Dep_Time), COUNT(*), ' \
+                 'SUM(TIMESTAMPDIFF(SECOND, Dep_Time, Arr_Time)), ' \
+                 'SUM(COALESCE(TIME_TO_SEC(Night_Time), 0)), ' \
+                 'SUM(COALESCE(TIME_TO_SEC(PIC_Time), 0)), ' \
+                 'SUM(COALESCE(TIME_TO_SEC(Copilot_Time), 0)), ' \
+                 'SUM(COALESCE(Ldg_Day, 0)), SUM(COALESCE(Ldg_Night, 0)) ' \
+                 'FROM logbook_flights '
+rebuild_query = rebuild_select + 'GROUP BY DATE(Dep_Time)'
+
+# the same back-fill for generated scripts, which cannot branch, a no-op once the table has rows
+# (the derived table lets MySQL read the table it is inserting into)
+backfill_query = rebuild_select + 'WHERE NOT EXISTS (SELECT 1 FROM (SELECT 1 FROM logbook_daily_totals LIMIT 1) T) ' \
+                                  'GROUP BY DATE(Dep_Time)'
+
+# summary sectors against flights, they differ when flights were loaded without the upserts
+check_query = 'SELECT (SELECT COUNT(*) FROM logbook_flights), ' \
+              '(SELECT COALESCE(SUM(Sectors), 0) FROM logbook_daily_totals)'
+
+window_query = 'SELECT `Day`, ' + ', '.join('`' + field + '`' for field in fields) + \
+               ' FROM logbook_daily_totals WHERE `Day` BETWEEN %s AND %s'
+
+# flight time limitation windows, 12 months is handled as a calendar year back from the end day
+ftl_windows = (('28 days', 28), ('90 days', 90), ('12 months', None))
+
+
+def flight_totals(flight):
+    """ returns (day, totals tuple in the order of fields) for an enriched flight dictionary """
+    total = int(flight['total_time'].total_seconds())
+    night = int(flight['night_time'].total_seconds())
+    if flight['name_pic'] == 'Self':
+        pic, copilot = total, 0
+    else:
+        pic, copilot = 0, total
+    return flight['dep_time'].date(), (1, total, night, pic, copilot, flight['ldg_day'], flight['ldg_ngt'])
+
+
+def day_totals(flights, days=None):
+    """ sums flight_totals per day, adding to days if given; returns the day -> totals dictionary """
+    if days is None:
+        days = {}
+    for flight in flights:
+        day, totals = flight_totals(flight)
+        days[day] = tuple(a + b for a, b in zip(days.get(day, (0,) * len(fields)), totals))
+    return days
+
+
+def add_flights(cursor, flights):
+    """ adds imported flights to the daily summary rows, one upsert per day touched,
+        the caller commits alongside the flight inserts """
+    days = day_totals(flights)
+    add_day_totals(cursor, days)
+    return len(days)
+
+
+def add_day_totals(cursor, days):
+    """ applies a dictionary of day -> totals tuple (deltas, which may be negative) """
+    if days:
+        pipeline_stats.count('db round trips')
+        cursor.executemany(add_query, [(day,) + totals for day, totals in sorted(days.items())])
+
+
+def ensure_table(cursor):
+    """ creates the summary table and back-fills it when it is empty but logbook_flights is not,
+        so totals never miss flights imported before the table existed; returns True if rebuilt """
+    pipeline_stats.count('db round trips')
+    cursor.execute(create_table)
+    pipeline_stats.count('db round trips')
+    cursor.execute('SELECT EXISTS(SELECT 1 FROM logbook_daily_totals), EXISTS(SELECT 1 FROM logbook_flights)')
+    has_totals, has_flights = cursor.fetchone()
+    if int(has_flights) and not int(has_totals):
+        rebuild(cursor)
+        return True
+    return False
+
+
+def check(cursor):
+    """ returns (flights, sectors in the summary rows), equal while the summary is in step """
+    pipeline_stats.count('db round trips')
+    cursor.execute(check_query)
+    flights, sectors = cursor.fetchone()
+    return int(flights), int(sectors)
+
+
+def rebuild(cursor):
+    """ recreates every summary row with a single pass over logbook_flights """
+    pipeline_stats.count('db round trips')
+    cursor.execute(create_table)
+    pipeline_stats.count('db round trips')
+    cursor.execute('DELETE FROM logbook_daily_totals')
+    pipeline_stats.count('db round trips')
+    cursor.execute(rebuild_query)
+
+
+def year_start(end_day):
+    """ first day of the 12 month window ending on end_day """
+    try:
+        start = end_day.replace(year=end_day.year - 1)
+    except ValueError:
+        # 29th February
+        start = end_day.replace(year=end_day.year - 1, day=28)
+    return start + datetime.timedelta(days=1)
+
+
+class DailyTotals(object):
+    """
+    Prefix sums over a range of daily summary rows. Loading reads one row per day in the
+    range, after which any window inside the range is answered by two lookups.
+    """
+
+    def __init__(self, first_day, last_day, rows=()):
+        """
+        @param first_day: The first date covered.
+        @param last_day: The last date covered.
+        @param rows: Tuples of (date, totals in the order of fields).
+        """
+        self.first_day = first_day
+        self.last_day = last_day
+        num_days = (last_day - first_day).days + 1
+        daily = [[0] * len(fields) for _ in range(num_days)]
+        for row in rows:
+            offset = (row[0] - first_day).days
+            if 0 <= offset < num_days:
+                daily[offset] = [int(value) for value in row[1:]]
+
+        self.__prefix = [(0,) * len(fields)]
+        for day in daily:
+            self.__prefix.append(tuple(a + b for a, b in zip(self.__prefix[-1], day)))
+
+    @classmethod
+    def load(cls, cursor, first_day, last_day):
+        pipeline_stats.count('db round trips')
+        cursor.execute(window_query, (first_day, last_day))
+        return cls(first_day, last_day, cursor.fetchall())
+
+    @classmethod
+    def load_ftl(cls, cursor, end_day):
+        """ loads enough days for all of the ftl_windows ending on end_day """
+        first_day = min(year_start(end_day), end_day - datetime.timedelta(days=89))
+        return cls.load(cursor, first_day, end_day)
+
+    def window(self, start_day, end_day):
+        """ returns a dictionary of field -> total for the days start_day to end_day inclusive,
+            time fields are returned as timedeltas """
+        if start_day < self.first_day or end_day > self.last_day:
+            raise ValueError('Window %s to %s outside loaded range %s to %s'
+                             % (start_day, end_day, self.first_day, self.last_day))
+        start = self.__prefix[(start_day - self.first_day).days]
+        end = self.__prefix[(end_day - self.first_day).days + 1]
+        totals = {}
+        for field, a, b in zip(fields, start, end):
+            totals[field] = datetime.timedelta(seconds=b - a) if field in time_fields else b - a
+        return totals
+
+    def rolling(self, end_day, days):
+        """ totals for the number of days ending on end_day """
+        return self.window(end_day - datetime.timedelta(days=days - 1), end_day)
+
+    def ftl_totals(self, end_day):
+        """ returns a list of (window name, totals) for the ftl_windows ending on end_day """
+        result = []
+        for name, days in ftl_windows:
+            if days is None:
+                result.append((name, self.window(year_start(end_day), end_day)))
+            else:
+                result.append((name, self.rolling(end_day, days)))
+        return result
+
+
+def print_ftl_totals(cursor, end_day):
+    import night_calc
+
+    flights, sectors = check(cursor)
+    if flights != sectors:
+        print('Warning: daily totals count %d sectors but logbook_flights has %d flights, '
+              'run rolling_totals.py rebuild' % (sectors, flights))
+    totals = DailyTotals.load_ftl(cursor, end_day)
+    print('Rolling totals to ' + end_day.isoformat())
+    for name, window in totals.ftl_totals(end_day):
+        print('  ' + name.ljust(10) + ' Total ' + night_calc.td_hhmm(window['Total_Time'])
+              + '  Night ' + night_calc.td_hhmm(window['Night_Time'])
+              + '  PIC ' + night_calc.td_hhmm(window['PIC_Time'])
+              + '  Copilot ' + night_calc.td_hhmm(window['Copilot_Time'])
+              + '  Ldg ' + str(window['Ldg_Day']) + '/' + str(window['Ldg_Night']))
+
+
+if __name__ == '__main__':
+    # usage: rolling_totals.py [rebuild | check] [yyyy-mm-dd]
+    import ecrew_sql
+
+    print('Opening database connection')
+    cnx = ecrew_sql.connect()
+    cursor = cnx.cursor()
+    args = sys.argv[1:]
+    if args and args[0] == 'rebuild':
+        print('Rebuilding daily totals')
+        rebuild(cursor)
+        pipeline_stats.count('db round trips')
+        cnx.commit()
+        args = args[1:]
+    elif args and args[0] == 'check':
+        flights, sectors = check(cursor)
+        print(str(flights) + ' flights, ' + str(sectors) + ' sectors in daily totals'
+              + ('' if flights == sectors else ' - out of step, run rolling_totals.py rebuild'))
+        cnx.close()
+        sys.exit(0 if flights == sectors else 1)
+    end = datetime.datetime.strptime(args[0], '%Y-%m-%d').date() if args else datetime.datetime.utcnow().date()
+    print_ftl_totals(cursor, end)
+    print('Closing database connection')
+    cnx.close()
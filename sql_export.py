@@ -0,0 +1,260 @@
+"""
+Writers that stream logbook records to disk for importing into a logbook database
+Records can be written as chunked multi-row INSERT statements or as delimited data
+files with a matching LOAD DATA LOCAL INFILE script for bulk loading
+Files are written as UTF-8 to match the utf8mb4 character set the scripts load with
+Flights written with write_flight also update logbook_daily_totals in the same transaction,
+so loading a script keeps the rolling totals in step with logbook_flights
+"""
+
+from __future__ import absolute_import
+from __future__ import print_function
+
+import datetime
+import os
+
+import rolling_totals
+
+# logbook format for datetime objects
+dform = '%Y-%m-%d %H:%M'
+
+# write buffer for output files, large enough to hold many records between flushes
+buffer_size = 1 << 16
+
+export_formats = ('insert', 'csv', 'tsv')
+
+
+def flight_record(flight):
+    """ returns a tuple of (columns, values) for inserting an enriched flight
+        dictionary into logbook_flights """
+    if flight['name_pic'] == 'Self':
+        columns = (
+            'Dep_Place', 'Arr_Place', 'Dep_Time', 'Arr_Time', 'Aircraft', 'PF', 'Name_PIC', 'Name_Copilot',
+            'Night_Time',
+            'Can_P1_XC_Night', 'IFR_Time', 'PIC_Time', 'Can_P1', 'Can_P1_XC', 'Function', 'Ldg_Day', 'Ldg_Night',
+            'Comments')
+
+        values = (
+            flight['dep_ICAO'], flight['arr_ICAO'], flight['dep_time'], flight['arr_time'],
+            flight['aircraft'], flight['PF'], flight['name_pic'], flight['name_copilot'], flight['night_time'],
+            flight['night_time'], flight['total_time'], flight['total_time'], flight['total_time'],
+            flight['total_time'], 'P1', flight['ldg_day'], flight['ldg_ngt'], flight['comments'])
+
+        if flight['instr']:  # Instructor time
+            columns += ('Instr_Time',)
+            values += (flight['total_time'],)
+
+    else:
+        columns = (
+            'Dep_Place', 'Arr_Place', 'Dep_Time', 'Arr_Time', 'Aircraft', 'PF', 'Name_PIC', 'Name_Copilot',
+            'Night_Time',
+            'IFR_Time', 'Copilot_Time', 'Function', 'Ldg_Day', 'Ldg_Night', 'Comments')
+
+        values = (
+            flight['dep_ICAO'], flight['arr_ICAO'], flight['dep_time'], flight['arr_time'],
+            flight['aircraft'], flight['PF'], flight['name_pic'], flight['name_copilot'], flight['night_time'],
+            flight['total_time'], flight['total_time'], 'FO', flight['ldg_day'], flight['ldg_ngt'],
+            flight['comments'])
+
+    return columns, values
+
+
+def insert_query(columns, table='logbook_flights'):
+    """ returns a parameterised INSERT statement for use with cursor.execute """
+    return 'INSERT INTO ' + table + ' (' + column_list(columns) + ') VALUES (' + \
+        ', '.join(['%s'] * len(columns)) + ')'
+
+
+def column_list(columns):
+    return ', '.join('`' + col + '`' for col in columns)
+
+
+def td_time(td):
+    """ helper function to convert a timedelta to a MySQL TIME string 'h:mm:ss',
+        str(timedelta) gives '1 day, 0:30:00' for long durations which MySQL rejects """
+    sec = int(round(td.total_seconds()))
+    sign = '-' if sec < 0 else ''
+    sec = abs(sec)
+    return '%s%d:%02d:%02d' % (sign, sec // 3600, (sec % 3600) // 60, sec % 60)
+
+
+def field_text(value):
+    """ converts a python value to the text MySQL expects for a column, None is not handled here """
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, datetime.datetime):
+        return value.strftime(dform)
+    if isinstance(value, datetime.timedelta):
+        return td_time(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf8')
+    return str(value)
+
+
+def sql_literal(value):
+    """ returns a value as an SQL literal, quoting and escaping strings """
+    if value is None:
+        return 'NULL'
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    text = field_text(value)
+    text = text.replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n').replace('\r', '\\r') \
+        .replace('\0', '\\0').replace('\x1a', '\\Z')
+    return "'" + text + "'"
+
+
+def daily_totals_preamble():
+    """ statements run before the flights: create and back-fill the summary table outside the
+        transaction, as DDL commits implicitly """
+    return [rolling_totals.create_table + ';\n', rolling_totals.backfill_query + ';\n', 'START TRANSACTION;\n']
+
+
+def daily_totals_statements(days):
+    """ returns the rolling_totals.add_query upserts for a day -> totals dictionary, then COMMIT """
+    return [rolling_totals.add_query % tuple(sql_literal(value) for value in (day,) + totals) + ';\n'
+            for day, totals in sorted(days.items())] + ['COMMIT;\n']
+
+
+class SqlInsertWriter(object):
+    """
+    Streams records to an SQL file as INSERT statements. Consecutive records with the same
+    columns are grouped into multi-row statements of up to rows_per_insert rows,
+    rows_per_insert=1 writes one statement per record. A duplicate flight stops the mysql
+    client inside the transaction, so neither the flights nor their totals are applied.
+    """
+
+    def __init__(self, output_file_name, table='logbook_flights', rows_per_insert=500):
+        self.output_file_name = output_file_name
+        self.table = table
+        self.rows_per_insert = max(1, rows_per_insert)
+        self.records = 0
+        self.statements = 0
+        self.__output_file = open(output_file_name, mode='w', buffering=buffer_size, encoding='utf-8')
+        self.__columns = None
+        self.__rows = []
+        self.__days = {}  # day -> totals for the flights written
+
+    def write(self, columns, values):
+        if columns != self.__columns or len(self.__rows) >= self.rows_per_insert:
+            self.flush()
+            self.__columns = columns
+        self.__rows.append('(' + ', '.join(sql_literal(value) for value in values) + ')')
+        self.records += 1
+
+    def write_flight(self, flight):
+        """ writes an enriched flight and adds it to the daily totals written on close """
+        if not self.__days:
+            self.flush()
+            self.__output_file.write(''.join(daily_totals_preamble()))
+        self.write(*flight_record(flight))
+        rolling_totals.day_totals([flight], self.__days)
+
+    def flush(self):
+        """ writes out the pending statement """
+        if not self.__rows:
+            return
+        self.__output_file.write('INSERT INTO ' + self.table + ' (' + column_list(self.__columns) + ') VALUES\n')
+        self.__output_file.write(',\n'.join(self.__rows))
+        self.__output_file.write(';\n')
+        self.__rows = []
+        self.statements += 1
+
+    def close(self):
+        self.flush()
+        if self.__days:
+            self.__output_file.write(''.join(daily_totals_statements(self.__days)))
+        self.__output_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LoadDataWriter(object):
+    """
+    Streams records to delimited data files and writes an SQL script of
+    LOAD DATA LOCAL INFILE statements to bulk load them. Each distinct set of
+    columns gets its own data file so that unused columns keep their defaults.
+    Data files are written in MySQL's default escaping with NULL as \\N.
+    LOAD DATA LOCAL skips duplicate rows with a warning while their totals are still added,
+    rolling_totals.check reports the difference.
+    """
+
+    def __init__(self, output_file_name, table='logbook_flights', delimiter='\t'):
+        if delimiter not in ('\t', ','):
+            raise ValueError('Invalid delimiter: %r' % delimiter)
+        self.output_file_name = output_file_name
+        self.table = table
+        self.delimiter = delimiter
+        self.records = 0
+        self.data_file_names = []
+        self.__layouts = {}  # columns -> open data file
+        self.__base_name = os.path.splitext(output_file_name)[0]
+        self.__extension = '.tsv' if delimiter == '\t' else '.csv'
+        self.__days = {}  # day -> totals for the flights written
+
+    def write(self, columns, values):
+        data_file = self.__layouts.get(columns)
+        if data_file is None:
+            data_file_name = self.__base_name + '_' + str(len(self.__layouts) + 1) + self.__extension
+            data_file = open(data_file_name, mode='w', buffering=buffer_size, encoding='utf-8', newline='')
+            self.__layouts[columns] = data_file
+            self.data_file_names.append(data_file_name)
+        data_file.write(self.delimiter.join(self.__field(value) for value in values) + '\n')
+        self.records += 1
+
+    def write_flight(self, flight):
+        """ writes an enriched flight and adds it to the daily totals loaded by the script """
+        self.write(*flight_record(flight))
+        rolling_totals.day_totals([flight], self.__days)
+
+    def __field(self, value):
+        if value is None:
+            return '\\N'
+        text = field_text(value)
+        text = text.replace('\\', '\\\\').replace('\0', '\\0').replace('\n', '\\n').replace('\r', '\\r')
+        if self.delimiter == '\t':
+            return text.replace('\t', '\\t')
+        if ',' in text or '"' in text:
+            return '"' + text.replace('"', '""') + '"'
+        return text
+
+    def close(self):
+        script = open(self.output_file_name, mode='w', encoding='utf-8')
+        if self.__days:
+            script.write(''.join(daily_totals_preamble()))
+        for data_file_name, columns in zip(self.data_file_names, self.__layouts):
+            self.__layouts[columns].close()
+            # the client resolves relative names against its own working directory
+            script.write('LOAD DATA LOCAL INFILE ' + sql_literal(os.path.abspath(data_file_name)) + '\n')
+            script.write('INTO TABLE ' + self.table + ' CHARACTER SET utf8mb4\n')
+            if self.delimiter == '\t':
+                script.write("FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'\n")
+            else:
+                script.write("FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '\\\\'\n")
+            script.write("LINES TERMINATED BY '\\n'\n")
+            script.write('(' + column_list(columns) + ');\n')
+        if self.__days:
+            script.write(''.join(daily_totals_statements(self.__days)))
+        script.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_writer(export_format, output_file_name, table='logbook_flights', rows_per_insert=500):
+    """ returns a writer for one of export_formats """
+    if export_format == 'insert':
+        return SqlInsertWriter(output_file_name, table, rows_per_insert)
+    if export_format == 'tsv':
+        return LoadDataWriter(output_file_name, table, '\t')
+    if export_format == 'csv':
+        return LoadDataWriter(output_file_name, table, ',')
+    raise ValueError('Invalid export format [%s] must be one of: %s' % (export_format, list(export_formats)))
@@ -42,6 +42,13 @@ import datetime
 from math import degrees, radians, atan2, cos, sin, pi, sqrt, fabs
 
 
+def no_stats(name, amount=1):
+    """
+    Default counter hook, see SunriseSunset.stats.
+    """
+    pass
+
+
 class SunriseSunset(object):
     """
     This class determines the sunrise and sunset for zenith standards for the
@@ -53,6 +60,11 @@ class SunriseSunset(object):
                 'nautical': -12.0,
                 'amateur': -15.0,
                 'astronomical': -18.0}
+    __cache = {}  # (year, month, day, lat, lon, zenith) -> (sunrise, sunset) UT hours
+    CACHE_SIZE = 100000
+    # Counter hook called as stats(name, amount) for calculations, cache hits
+    # and solver iterations, replace it to collect the counts.
+    stats = no_stats
 
     def __init__(self, date, lat, lon, zenith='official'):
         """
@@ -155,11 +167,24 @@ class SunriseSunset(object):
         year = self.__dateLocal.year
         month = self.__dateLocal.month
         day = self.__dateLocal.day
-        # Ephemeris
-        ephem2000_day = 367 * year - (7 * (year + (month + 9) / 12) / 4) + \
-            (275 * month / 9) + day - 730531.5
-        self.__sunrise = self.__determine_rise_or_set(ephem2000_day, 1)
-        self.__sunset = self.__determine_rise_or_set(ephem2000_day, -1)
+        # The UT of sunrise and sunset only depend on the date and position so
+        # are shared between instances, is_night alone creates several per call.
+        key = (year, month, day, self.__lat, self.__lon, self.__zenith)
+        riseset = self.__cache.get(key)
+        if riseset is None:
+            SunriseSunset.stats('solar calculations')
+            # Ephemeris
+            ephem2000_day = 367 * year - (7 * (year + (month + 9) / 12) / 4) + \
+                (275 * month / 9) + day - 730531.5
+            riseset = (self.__determine_rise_or_set(ephem2000_day, 1),
+                       self.__determine_rise_or_set(ephem2000_day, -1))
+            if len(self.__cache) >= self.CACHE_SIZE:
+                self.__cache.clear()
+            self.__cache[key] = riseset
+        else:
+            SunriseSunset.stats('solar cache hits')
+        self.__sunrise = self.__get_24_hour_local_time(1, riseset[0])
+        self.__sunset = self.__get_24_hour_local_time(-1, riseset[1])
 
     def __determine_rise_or_set(self, ephem2000_day, rs):
         """
@@ -169,7 +194,7 @@ class SunriseSunset(object):
                              21st century.
         @param rs: The factor that determines either sunrise or sunset where
                    1 equals sunrise and -1 sunset.
-        @return: Either the sunrise or sunset as a C{datetime} object.
+        @return: Either the sunrise or sunset as a decimal UT hour.
         """
         utold = pi
         utnew = 0
@@ -208,9 +233,10 @@ class SunriseSunset(object):
             # print cosc, correction, utold, utnew
             utnew = self.__get_range(utold - (gha + lon + rs * correction))
 
+        SunriseSunset.stats('solar solver iterations', ct)
         decimal_time = degrees(utnew) / 15
         # print utnew, decimal_time
-        return self.__get_24_hour_local_time(rs, decimal_time)
+        return decimal_time
 
     def __get_range(self, value):
         """
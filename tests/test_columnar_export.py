@@ -0,0 +1,64 @@
+import datetime
+
+import pytest
+
+import columnar_export
+import ecrew_logbook
+
+
+def test_epoch_and_seconds():
+    assert columnar_export.epoch(datetime.datetime(1970, 1, 2)) == 86400
+    assert columnar_export.seconds(datetime.timedelta(hours=1, minutes=30)) == 5400
+    assert columnar_export.seconds(None) == -1
+    assert columnar_export.text(bytearray(b'EGLL')) == 'EGLL'
+    assert columnar_export.integer(None) == -1
+
+
+def test_dictionary_encoding():
+    dictionaries = {}
+    table = columnar_export.ColumnTable((('when', 'q'), ('place', 'dict')), dictionaries)
+    for when, place in ((1, 'EGLL'), (2, 'LFPG'), (3, 'EGLL')):
+        table.append({'when': when, 'place': place})
+
+    assert table.rows == 3
+    assert list(table.column('when')) == [1, 2, 3]
+    assert list(table.column('place')) == [0, 1, 0]
+    assert dictionaries == {'place': {'EGLL': 0, 'LFPG': 1}}
+
+
+def test_airports_share_a_dictionary():
+    writer = columnar_export.ColumnarWriter('unused.npz')
+    dep_time = datetime.datetime(2020, 1, 1, 8, 0)
+    for dep, arr in (('EGLL', 'LFPG'), ('LFPG', 'EGLL')):
+        writer.add_flight({'dep_time': dep_time, 'arr_time': dep_time + datetime.timedelta(hours=1),
+                           'dep_place': dep, 'arr_place': arr, 'reg': 'GABCD', 'name_pic': 'Self',
+                           'aircraft_type': 'A320'})
+
+    assert writer.flights.dictionary_name('arr_airport') == 'airport'
+    assert writer.dictionary_values('airport') == ['EGLL', 'LFPG']
+    assert list(writer.flights.column('dep_airport')) == [0, 1]
+    assert list(writer.flights.column('arr_airport')) == [1, 0]
+    assert writer.dictionary_values('aircraft_type') == ['A320']
+    assert list(writer.flights.column('pf')) == [-1, -1]
+
+
+def test_export_airports_needs_report(capsys):
+    with pytest.raises(SystemExit):
+        ecrew_logbook.main(['export', 'out.npz', '--airports', 'airports.csv'])
+    assert '--airports needs --report' in capsys.readouterr().err
+
+
+def test_export_reports_with_airports_file(tmp_path, capsys):
+    import os
+
+    data = os.path.join(os.path.dirname(__file__), 'data')
+    output = str(tmp_path / 'flights.npz')
+    assert ecrew_logbook.main(['export', output, '--report', os.path.join(data, 'report.htm'),
+                               '--airports', os.path.join(data, 'airports.csv')]) == 0
+    assert '10 flights and 1 sims saved' in capsys.readouterr().out
+
+    numpy = pytest.importorskip('numpy')
+    arrays = numpy.load(output)
+    assert len(arrays['flights.dep_time']) == 10
+    assert list(arrays['flights.aircraft_type.dictionary']) == ['']
+    assert 'EIDW' in list(arrays['flights.dep_airport.dictionary'])
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import ecrew_logbook
+
+data = os.path.join(os.path.dirname(__file__), 'data')
+report = os.path.join(data, 'report.htm')
+airports = os.path.join(data, 'airports.csv')
+
+
+def test_parse(capsys):
+    assert ecrew_logbook.main(['parse', report]) == 0
+    assert '10 flights and 1 sims were successfully read' in capsys.readouterr().out
+
+
+def test_import_dry_run(capsys):
+    assert ecrew_logbook.main(['import', report, '--dry-run', '--airports', airports]) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[-1] == '10 flights processed, nothing written to the database'
+    assert lines[2] == 'EIDW KJFK 2019-01-01 04:05 2019-01-01 09:40 05:35 night 05:35 N EIDA'
+
+
+def test_import_dry_run_zenith(capsys):
+    ecrew_logbook.main(['import', report, '--dry-run', '--airports', airports])
+    civil = capsys.readouterr().out
+    ecrew_logbook.main(['import', report, '--dry-run', '--airports', airports, '--zenith', 'nautical'])
+    nautical = capsys.readouterr().out
+    assert 'KJFK EGLL 2019-01-11 17:05 2019-01-11 19:40 02:35 night 00:54' in civil
+    assert 'KJFK EGLL 2019-01-11 17:05 2019-01-11 19:40 02:35 night 00:41' in nautical
+
+
+def test_import_dry_run_missing_airport(tmp_path, capsys):
+    partial = tmp_path / 'airports.csv'
+    partial.write_text(''.join(open(airports).readlines()[:-1]))  # without MAD
+    assert ecrew_logbook.main(['import', report, '--dry-run', '--airports', str(partial)]) == 1
+    assert '(MAD)' in capsys.readouterr().out
+
+
+def test_validate_with_airports_file(capsys):
+    assert ecrew_logbook.main(['validate', report, '--airports', airports]) == 0
+    assert '10 flights are ready to import' in capsys.readouterr().out
+
+
+def test_recheck_night_dry_run_needs_airports(capsys):
+    with pytest.raises(SystemExit):
+        ecrew_logbook.main(['recheck-night', '--dry-run'])
+    assert '--dry-run needs airports' in capsys.readouterr().err
@@ -0,0 +1,108 @@
+import datetime
+import os
+
+import ecrew_service
+import ecrew_sql
+import pipeline_stats
+
+report_file = os.path.join(os.path.dirname(__file__), 'data', 'report.htm')
+airport_rows = [(b'DUB', b'EIDW', 53.4213, -6.2701), (b'LHR', b'EGLL', 51.47, -0.4543),
+                (b'JFK', b'KJFK', 40.6413, -73.7781), (b'CDG', b'LFPG', 49.0097, 2.5479),
+                (b'MAD', b'LEMD', 40.4983, -3.5676)]
+aircraft_rows = [(b'EIDA', 1, b'A320'), (b'EIDB', 2, b'A320'), (b'EIDC', 3, None)]
+
+
+class StubCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.last = None
+
+    def execute(self, query, params=None):
+        self.connection.queries.append(query)
+        self.last = query
+
+    def executemany(self, query, params):
+        self.connection.queries.append(query)
+
+    def fetchall(self):
+        if 'FROM logbook_airports' in self.last:
+            return airport_rows
+        if 'FROM logbook_aircraft' in self.last:
+            return aircraft_rows
+        return []
+
+    def fetchone(self):
+        return 1, 1  # daily totals already populated
+
+    def close(self):
+        pass
+
+
+class StubConnection(object):
+    def __init__(self, pool):
+        self.pool = pool
+        self.queries = pool.queries
+
+    def cursor(self, **kwargs):
+        return StubCursor(self)
+
+    def commit(self):
+        self.pool.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.pool.checked_out -= 1
+
+
+class StubPool(object):
+    def __init__(self):
+        self.queries = []
+        self.commits = 0
+        self.checked_out = 0
+
+    def get_connection(self):
+        self.checked_out += 1
+        return StubConnection(self)
+
+
+def test_process_report_returns_worker_stats():
+    ecrew_service.init_worker(ecrew_sql.ReferenceMaps.load(StubPool().get_connection().cursor()).airports)
+    with open(report_file) as report:
+        flights, sims, night_arrivals, missing_airports, stats = ecrew_service.process_report(report.read())
+    assert len(flights) == 10 and len(sims) == 1
+    assert len(night_arrivals) == 10 and missing_airports == []
+    assert stats['counters']['flights parsed'] == 10
+    assert stats['counters'].get('solar calculations', 0) + stats['counters'].get('solar cache hits', 0) > 0
+
+
+def test_import_service_with_stub_pool():
+    pool = StubPool()
+    service = ecrew_service.ImportService(workers=1, pool=pool)
+    try:
+        pipeline_stats.reset()
+        with open(report_file) as report:
+            report_text = report.read()
+
+        code, body = service.flights(report_text, {})
+        assert code == 200
+        assert len(body['flights']) == 10 and body['missing_airports'] == [] and body['missing_aircraft'] == []
+        assert body['flights'][0]['dep_ICAO'] == 'EIDW'
+        datetime.datetime.strptime(body['flights'][0]['dep_time'], ecrew_sql.dform)
+
+        code, status = service.status()
+        assert status['airports'] == 5 and status['aircraft'] == 3
+        # counted in the worker process and merged into the service's totals
+        assert status['stats']['counters']['flights parsed'] == 10
+        assert status['stats']['counters']['reports processed'] == 1
+
+        code, body = service.insert(report_text, {'pf': '1,0', 'copilot': 'Jones'})
+        assert code == 200 and body['inserted'] == 10 and body['failures'] == 0
+        assert body['flights'][0]['PF'] == 1 and body['flights'][1]['PF'] == 0
+        assert pool.checked_out == 0
+
+        service.reload()
+        assert service.flights(report_text, {})[0] == 200
+    finally:
+        service.close()
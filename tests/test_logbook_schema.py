@@ -0,0 +1,75 @@
+import logbook_schema
+
+
+class SchemaCursor(object):
+    """ answers the information_schema queries from a declared set of tables and indexes """
+
+    def __init__(self, columns, indexes, duplicates=()):
+        self.columns = columns  # [(table, column)]
+        self.indexes = indexes  # [(table, index name, non unique, column)] in column order
+        self.duplicates = list(duplicates)
+        self.queries = []
+        self.last = None
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        self.last = query
+
+    def fetchall(self):
+        if 'information_schema.COLUMNS' in self.last:
+            return self.columns
+        if 'information_schema.STATISTICS' in self.last:
+            return self.indexes
+        if 'HAVING COUNT(*) > 1' in self.last:
+            return self.duplicates
+        return []
+
+
+def full_columns(skip=()):
+    return [(table.encode(), column.encode()) for table, columns in logbook_schema.tables
+            for column, definition in columns if (table, column) not in skip]
+
+
+def test_index_satisfied_by_prefix():
+    existing = [(('registration', 'id', 'type'), False), (('dep_time', 'dep_place'), True)]
+    assert logbook_schema.index_satisfied(existing, ('Registration',), False)
+    assert logbook_schema.index_satisfied(existing, ('Registration', 'ID'), False)
+    assert not logbook_schema.index_satisfied(existing, ('ID',), False)
+    assert logbook_schema.index_satisfied(existing, ('Dep_Time', 'Dep_Place'), True)
+    # a unique index must match exactly, a wider unique index allows duplicates of the prefix
+    assert not logbook_schema.index_satisfied(existing, ('Dep_Time',), True)
+    assert not logbook_schema.index_satisfied([(('dep_time', 'dep_place'), False)], ('Dep_Time', 'Dep_Place'), True)
+
+
+def test_check_reports_missing_tables_columns_and_indexes():
+    columns = [row for row in full_columns(skip=[('logbook_flights', 'Comments')])
+               if row[0] != b'logbook_aircraft_type']
+    indexes = [(table.encode(), name.encode(), int(not unique), column.encode())
+               for table, name, index_columns, unique in logbook_schema.indexes
+               if table != 'logbook_flights' for column in index_columns]
+    missing_tables, missing_columns, missing_indexes = logbook_schema.check(SchemaCursor(columns, indexes))
+
+    assert missing_tables == ['logbook_aircraft_type']
+    assert missing_columns == [('logbook_flights', 'Comments')]
+    assert [index[1] for index in missing_indexes] == ['idx_flights_aircraft', 'idx_flights_dep_place',
+                                                       'idx_flights_arr_place', 'uq_flights_identity']
+
+
+def test_migrate_one_alter_per_table_and_skips_duplicates():
+    cursor = SchemaCursor(full_columns(), [], duplicates=[('2020-01-01 06:00', 'EIDW', 2)])
+    applied, skipped = logbook_schema.migrate(cursor)
+
+    alters = [query for query in cursor.queries if query.startswith('ALTER TABLE')]
+    assert len(alters) == len(set(index[0] for index in logbook_schema.indexes))
+    assert 'ALTER TABLE logbook_flights ADD INDEX `idx_flights_aircraft` (`Aircraft`), ' \
+           'ADD INDEX `idx_flights_dep_place` (`Dep_Place`), ADD INDEX `idx_flights_arr_place` (`Arr_Place`)' in alters
+    assert [index[1] for index, found in skipped] == ['uq_flights_identity']
+    assert 'uq_flights_identity' not in ' '.join(alters)
+    assert len(applied) == len(logbook_schema.indexes) - 1
+
+
+def test_migrate_adds_unique_index_without_duplicates():
+    cursor = SchemaCursor(full_columns(), [])
+    applied, skipped = logbook_schema.migrate(cursor)
+    assert skipped == []
+    assert any('ADD UNIQUE INDEX `uq_flights_identity` (`Dep_Time`, `Dep_Place`)' in query for query in cursor.queries)
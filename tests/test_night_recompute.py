@@ -0,0 +1,82 @@
+import datetime
+
+import night_recompute
+import rolling_totals
+
+dub = (53.4213, -6.2701)
+lhr = (51.47, -0.4543)
+
+
+class FakeCursor(object):
+    def __init__(self, flights):
+        self.flights = flights
+        self.queries = []
+        self.last = None
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        self.last = query
+
+    def executemany(self, query, params):
+        self.queries.append((query, list(params)))
+
+    def fetchall(self):
+        if self.last.startswith('SELECT F.ID, F.Dep_Time'):
+            return self.flights
+        return [(7,), (3,)]
+
+    def fetchone(self):
+        # summary table already populated
+        return 1, 1
+
+
+def row(flight_id, dep_time, arr_time, night_minutes, ldg_day, ldg_night):
+    return (flight_id, dep_time, dub[0], dub[1], arr_time, lhr[0], lhr[1],
+            datetime.timedelta(minutes=night_minutes), ldg_day, ldg_night)
+
+
+def test_recompute_swaps_landing_and_records_day_delta():
+    dusk = row(1, datetime.datetime(2020, 1, 1, 15), datetime.datetime(2020, 1, 1, 18), 0, 1, 0)
+    day = row(2, datetime.datetime(2020, 6, 1, 10), datetime.datetime(2020, 6, 1, 11), 0, 1, 0)
+    cursor = FakeCursor([dusk, day])
+
+    changes = night_recompute.recompute(cursor, [1, 2])
+
+    assert [change[0] for change in changes] == [1]
+    new_night = changes[0][2]
+    assert new_night.total_seconds() % 60 == 0 and new_night > datetime.timedelta(0)
+    updates = [params for query, params in cursor.queries if query == night_recompute.update_query][0]
+    assert updates == [(new_night, new_night, 0, 1, 1)]
+    deltas = [params for query, params in cursor.queries if query == rolling_totals.add_query][0]
+    assert deltas == [(datetime.date(2020, 1, 1), 0, 0, int(new_night.total_seconds()), 0, 0, -1, 1)]
+
+
+def test_recompute_dry_run_writes_nothing():
+    cursor = FakeCursor([row(1, datetime.datetime(2020, 1, 1, 15), datetime.datetime(2020, 1, 1, 18), 0, 0, 0)])
+    changes = night_recompute.recompute(cursor, [1], apply_changes=False)
+    assert len(changes) == 1
+    assert all(query.startswith('SELECT') for query, params in cursor.queries)
+
+
+def test_recompute_unchanged_flight_skipped():
+    cursor = FakeCursor([row(1, datetime.datetime(2020, 1, 1, 15), datetime.datetime(2020, 1, 1, 18), 0, 0, 0)])
+    night = night_recompute.recompute(cursor, [1], apply_changes=False)[0][2]
+    cursor = FakeCursor([row(1, datetime.datetime(2020, 1, 1, 15), datetime.datetime(2020, 1, 1, 18),
+                             night.total_seconds() / 60, 0, 1)])
+    assert night_recompute.recompute(cursor, [1]) == []
+
+
+def test_affected_flights_queries_both_places():
+    cursor = FakeCursor([])
+    assert night_recompute.affected_flights(cursor, ['EIDW', 'EGLL']) == [3, 7]
+    query, params = cursor.queries[0]
+    assert 'F.Dep_Place IN (%s, %s)' in query and 'F.Arr_Place IN (%s, %s)' in query and ' UNION ' in query
+    assert params == ('EIDW', 'EGLL', 'EIDW', 'EGLL')
+    assert 'Turbine' not in query
+
+
+def test_affected_flights_turbine_only():
+    cursor = FakeCursor([])
+    night_recompute.affected_flights(cursor, ['EIDW'], turbine_only=True)
+    query = cursor.queries[0][0]
+    assert query.count('LT.Turbine = 1') == 2 and ' UNION ' in query
@@ -0,0 +1,55 @@
+import json
+
+import pipeline_stats
+
+
+def test_counters_and_timers(tmp_path):
+    pipeline_stats.reset()
+    pipeline_stats.count('rows')
+    pipeline_stats.count('rows', 4)
+    pipeline_stats.add_time('stage', 0.5)
+    pipeline_stats.add_time('stage', 1.5)
+    with pipeline_stats.timer('block'):
+        pass
+
+    snapshot = pipeline_stats.snapshot()
+    assert snapshot['counters'] == {'rows': 5}
+    assert snapshot['timers']['stage'] == {'calls': 2, 'total': 2.0, 'mean': 1.0, 'max': 1.5}
+    assert snapshot['timers']['block']['calls'] == 1
+
+    file_name = str(tmp_path / 'stats.json')
+    pipeline_stats.write_json(file_name)
+    assert json.load(open(file_name))['counters'] == {'rows': 5}
+    assert pipeline_stats.summary()[0].startswith('Stage')
+
+
+def test_merge_worker_snapshot():
+    pipeline_stats.reset()
+    pipeline_stats.count('rows', 2)
+    pipeline_stats.add_time('stage', 1.0)
+    worker = {'counters': {'rows': 3, 'flights parsed': 10},
+              'timers': {'stage': {'calls': 2, 'total': 3.0, 'mean': 1.5, 'max': 2.5},
+                         'parse report': {'calls': 1, 'total': 0.25, 'mean': 0.25, 'max': 0.25}}}
+    pipeline_stats.merge(worker)
+
+    snapshot = pipeline_stats.snapshot()
+    assert snapshot['counters'] == {'rows': 5, 'flights parsed': 10}
+    assert snapshot['timers']['stage'] == {'calls': 3, 'total': 4.0, 'mean': 4.0 / 3, 'max': 2.5}
+    assert snapshot['timers']['parse report']['calls'] == 1
+
+
+def test_counts_from_threads():
+    import threading
+
+    pipeline_stats.reset()
+
+    def work():
+        for _ in range(10000):
+            pipeline_stats.count('rows')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pipeline_stats.snapshot()['counters'] == {'rows': 40000}
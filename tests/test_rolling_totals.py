@@ -0,0 +1,109 @@
+import datetime
+
+import pytest
+
+import rolling_totals
+
+day = datetime.date
+
+
+class RecordingCursor(object):
+    def __init__(self, results=()):
+        self.queries = []
+        self.results = list(results)
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+
+    def executemany(self, query, params):
+        self.queries.append((query, list(params)))
+
+    def fetchone(self):
+        return self.results.pop(0)
+
+
+def flight(dep_time, minutes, night, name_pic='Self', ldg_day=1, ldg_ngt=0):
+    return {'dep_time': dep_time, 'total_time': datetime.timedelta(minutes=minutes),
+            'night_time': datetime.timedelta(minutes=night), 'name_pic': name_pic,
+            'ldg_day': ldg_day, 'ldg_ngt': ldg_ngt}
+
+
+def test_year_start():
+    assert rolling_totals.year_start(day(2020, 6, 15)) == day(2019, 6, 16)
+    assert rolling_totals.year_start(day(2020, 2, 29)) == day(2019, 3, 1)
+    assert rolling_totals.year_start(day(2021, 3, 1)) == day(2020, 3, 2)
+
+
+def test_flight_totals_pic_and_copilot():
+    assert rolling_totals.flight_totals(flight(datetime.datetime(2020, 1, 1, 23), 90, 30)) == \
+        (day(2020, 1, 1), (1, 5400, 1800, 5400, 0, 1, 0))
+    assert rolling_totals.flight_totals(flight(datetime.datetime(2020, 1, 1), 60, 0, 'Jones', 0, 0))[1] == \
+        (1, 3600, 0, 0, 3600, 0, 0)
+
+
+def test_add_flights_one_upsert_per_day():
+    cursor = RecordingCursor()
+    flights = [flight(datetime.datetime(2020, 1, 1, 6), 60, 0), flight(datetime.datetime(2020, 1, 1, 9), 30, 10),
+               flight(datetime.datetime(2020, 1, 2, 6), 60, 0, ldg_day=0, ldg_ngt=1)]
+    assert rolling_totals.add_flights(cursor, flights) == 2
+    query, rows = cursor.queries[0]
+    assert query == rolling_totals.add_query
+    assert rows == [(day(2020, 1, 1), 2, 5400, 600, 5400, 0, 2, 0), (day(2020, 1, 2), 1, 3600, 0, 3600, 0, 0, 1)]
+
+
+def test_window_prefix_sums():
+    rows = [(day(2020, 1, 1) + datetime.timedelta(days=i), 1, 3600, 60 * i, 3600, 0, 1, 0) for i in range(10)]
+    totals = rolling_totals.DailyTotals(day(2019, 12, 20), day(2020, 1, 20), rows)
+    window = totals.window(day(2020, 1, 3), day(2020, 1, 5))
+    assert window['Sectors'] == 3
+    assert window['Total_Time'] == datetime.timedelta(hours=3)
+    assert window['Night_Time'] == datetime.timedelta(minutes=2 + 3 + 4)
+    assert totals.rolling(day(2020, 1, 20), 28)['Sectors'] == 10
+    assert totals.window(day(2019, 12, 25), day(2019, 12, 31))['Sectors'] == 0
+
+
+def test_window_outside_loaded_range():
+    totals = rolling_totals.DailyTotals(day(2020, 1, 1), day(2020, 1, 31))
+    with pytest.raises(ValueError):
+        totals.window(day(2019, 12, 31), day(2020, 1, 5))
+
+
+def test_ftl_totals_12_months_across_leap_day():
+    rows = [(day(2019, 3, 1), 1, 100, 0, 0, 0, 0, 0), (day(2019, 2, 28), 1, 100, 0, 0, 0, 0, 0)]
+    totals = rolling_totals.DailyTotals(day(2019, 1, 1), day(2020, 2, 29), rows)
+    windows = dict(totals.ftl_totals(day(2020, 2, 29)))
+    assert windows['12 months']['Sectors'] == 1
+    assert windows['28 days']['Sectors'] == 0
+
+
+def test_ensure_table_back_fills_empty_totals():
+    cursor = RecordingCursor([(0, 1)])
+    assert rolling_totals.ensure_table(cursor)
+    assert cursor.queries[-1][0] == rolling_totals.rebuild_query
+
+    cursor = RecordingCursor([(1, 1)])
+    assert not rolling_totals.ensure_table(cursor)
+    cursor = RecordingCursor([(0, 0)])
+    assert not rolling_totals.ensure_table(cursor)
+
+
+def test_check_compares_sectors_with_flights():
+    cursor = RecordingCursor([(12, 10)])
+    assert rolling_totals.check(cursor) == (12, 10)
+    assert cursor.queries == [(rolling_totals.check_query, None)]
+    assert 'WHERE NOT EXISTS' in rolling_totals.backfill_query
+    assert rolling_totals.rebuild_query.endswith('FROM logbook_flights GROUP BY DATE(Dep_Time)')
+
+
+def test_round_trips_counted():
+    import pipeline_stats
+
+    pipeline_stats.reset()
+    rolling_totals.ensure_table(RecordingCursor([(0, 1)]))
+    # create, exists check, then create, delete and insert for the rebuild
+    assert pipeline_stats.counters['db round trips'] == 5
+
+    cursor = RecordingCursor()
+    cursor.fetchall = lambda: []
+    rolling_totals.DailyTotals.load(cursor, day(2020, 1, 1), day(2020, 1, 31))
+    assert pipeline_stats.counters['db round trips'] == 6
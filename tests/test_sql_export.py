@@ -0,0 +1,136 @@
+import datetime
+import os
+
+import rolling_totals
+import sql_export
+
+
+def flight(**changes):
+    values = {'name_pic': 'Self', 'dep_ICAO': 'EIDW', 'arr_ICAO': 'EGLL',
+              'dep_time': datetime.datetime(2020, 1, 1, 5, 0), 'arr_time': datetime.datetime(2020, 1, 1, 6, 15),
+              'aircraft': 3, 'PF': 1, 'name_copilot': 'Smith', 'night_time': datetime.timedelta(minutes=20),
+              'total_time': datetime.timedelta(minutes=75), 'instr': 0, 'ldg_day': 1, 'ldg_ngt': 0,
+              'comments': '-'}
+    values.update(changes)
+    return values
+
+
+def test_td_time_over_24_hours():
+    assert sql_export.td_time(datetime.timedelta(hours=25, minutes=3, seconds=4)) == '25:03:04'
+    assert sql_export.td_time(datetime.timedelta(minutes=5)) == '0:05:00'
+    assert sql_export.td_time(-datetime.timedelta(minutes=90)) == '-1:30:00'
+
+
+def test_sql_literal_escaping():
+    assert sql_export.sql_literal(None) == 'NULL'
+    assert sql_export.sql_literal(True) == '1'
+    assert sql_export.sql_literal(7) == '7'
+    assert sql_export.sql_literal("O'Neill\\x\n") == "'O\\'Neill\\\\x\\n'"
+    assert sql_export.sql_literal(bytearray(b'EIDW')) == "'EIDW'"
+    assert sql_export.sql_literal(datetime.datetime(2020, 1, 2, 3, 4)) == "'2020-01-02 03:04'"
+    assert sql_export.sql_literal(datetime.timedelta(days=1, minutes=30)) == "'24:30:00'"
+
+
+def test_flight_record_columns():
+    columns, values = sql_export.flight_record(flight())
+    assert len(columns) == len(values)
+    assert 'PIC_Time' in columns and 'Instr_Time' not in columns
+
+    columns, values = sql_export.flight_record(flight(instr=1))
+    assert columns[-1] == 'Instr_Time'
+
+    columns, values = sql_export.flight_record(flight(name_pic='Jones'))
+    assert 'Copilot_Time' in columns and values[columns.index('Function')] == 'FO'
+
+
+def test_insert_writer_groups_rows(tmp_path):
+    file_name = str(tmp_path / 'out.sql')
+    writer = sql_export.SqlInsertWriter(file_name, rows_per_insert=2)
+    for record in (flight(), flight(), flight(), flight(name_pic='Jones')):
+        writer.write(*sql_export.flight_record(record))
+    writer.close()
+    assert writer.records == 4
+    # two full P1 rows, the third P1 row and then the FO layout
+    assert writer.statements == 3
+    assert open(file_name).read().count('INSERT INTO logbook_flights') == 3
+
+
+def test_load_data_tsv_escaping(tmp_path):
+    file_name = str(tmp_path / 'out.sql')
+    writer = sql_export.LoadDataWriter(file_name, delimiter='\t')
+    writer.write(('A', 'B', 'C'), ('tab\there', 'back\\slash\nline', None))
+    writer.close()
+    assert open(writer.data_file_names[0]).read() == 'tab\\there\tback\\\\slash\\nline\t\\N\n'
+    script = open(file_name).read()
+    assert "LOAD DATA LOCAL INFILE '" + os.path.abspath(writer.data_file_names[0]) + "'" in script
+    assert '(`A`, `B`, `C`);' in script
+
+
+def test_load_data_csv_quoting(tmp_path):
+    file_name = str(tmp_path / 'out.sql')
+    writer = sql_export.LoadDataWriter(file_name, delimiter=',')
+    writer.write(('A', 'B', 'C'), ('Smith, "J"', 'plain', datetime.timedelta(hours=26)))
+    writer.close()
+    assert open(writer.data_file_names[0]).read() == '"Smith, ""J""",plain,26:00:00\n'
+
+
+def test_load_data_file_per_layout(tmp_path):
+    writer = sql_export.open_writer('csv', str(tmp_path / 'out.sql'))
+    for record in (flight(), flight(name_pic='Jones'), flight()):
+        writer.write(*sql_export.flight_record(record))
+    writer.close()
+    assert len(writer.data_file_names) == 2
+    assert len(open(writer.data_file_names[0]).readlines()) == 2
+
+
+def test_files_are_utf8(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    insert_writer = sql_export.open_writer('insert', 'out.sql')
+    insert_writer.write(('Name_PIC',), ('Ó Súilleabháin',))
+    insert_writer.close()
+    assert "'Ó Súilleabháin'" in open('out.sql', encoding='utf-8').read()
+
+    writer = sql_export.open_writer('tsv', 'load.sql')
+    writer.write(('Name_PIC',), ('Müller',))
+    writer.close()
+    assert open(writer.data_file_names[0], encoding='utf-8').read() == 'Müller\n'
+    assert "LOAD DATA LOCAL INFILE '" + str(tmp_path / 'load_1.tsv') + "'" in open('load.sql', encoding='utf-8').read()
+
+
+def script_totals(script):
+    """ sums the Sectors and Total_Time of the daily totals upserts in a script """
+    sectors = total = 0
+    for line in script.splitlines():
+        if line.startswith('INSERT INTO logbook_daily_totals') and 'VALUES (' in line:
+            values = line.split('VALUES (')[1].split(')')[0].split(', ')
+            sectors += int(values[1])
+            total += int(values[2])
+    return sectors, total
+
+
+def test_scripts_keep_daily_totals_in_step(tmp_path):
+    flights = [flight(), flight(dep_time=datetime.datetime(2020, 1, 1, 9, 0)),
+               flight(name_pic='Jones', dep_time=datetime.datetime(2020, 1, 2, 5, 0))]
+    for export_format in sql_export.export_formats:
+        file_name = str(tmp_path / (export_format + '.sql'))
+        writer = sql_export.open_writer(export_format, file_name)
+        for record in flights:
+            writer.write_flight(record)
+        writer.close()
+
+        script = open(file_name, encoding='utf-8').read()
+        assert script_totals(script) == (3, 3 * 75 * 60)
+        # the summary table is created and back-filled before any flights are loaded,
+        # the flights and their totals are committed together
+        first_flight = script.index('LOAD DATA' if export_format != 'insert' else 'INSERT INTO logbook_flights')
+        assert script.index(rolling_totals.backfill_query) < script.index('START TRANSACTION') < first_flight
+        assert script.index('ON DUPLICATE KEY UPDATE') > first_flight
+        assert script.endswith('COMMIT;\n')
+
+
+def test_plain_records_write_no_totals(tmp_path):
+    file_name = str(tmp_path / 'out.sql')
+    writer = sql_export.open_writer('insert', file_name)
+    writer.write(('A',), (1,))
+    writer.close()
+    assert 'logbook_daily_totals' not in open(file_name).read()
@@ -0,0 +1,59 @@
+import datetime
+
+import night_calc
+import pipeline_stats
+from sunrisesunset import SunriseSunset
+
+
+def clear_cache():
+    SunriseSunset._SunriseSunset__cache.clear()
+
+
+def test_cache_hit_matches_calculation():
+    date = datetime.datetime(2020, 1, 1, 12, tzinfo=night_calc.UTC())
+    clear_cache()
+    pipeline_stats.reset()
+    calculated = SunriseSunset(date, 53.42, -6.27, 'civil').get_sunriseset()
+    assert pipeline_stats.counters['solar calculations'] == 1
+    assert pipeline_stats.counters['solar solver iterations'] > 0
+
+    cached = SunriseSunset(date.replace(hour=20), 53.42, -6.27, 'civil').get_sunriseset()
+    assert pipeline_stats.counters['solar cache hits'] == 1
+    assert cached == calculated
+
+
+def test_cache_keyed_on_position_and_zenith():
+    date = datetime.datetime(2020, 6, 1, 12, tzinfo=night_calc.UTC())
+    clear_cache()
+    civil = SunriseSunset(date, 53.42, -6.27, 'civil').get_sunriseset()
+    official = SunriseSunset(date, 53.42, -6.27, 'official').get_sunriseset()
+    moved = SunriseSunset(date, 51.47, -0.45, 'civil').get_sunriseset()
+    assert civil[0] < official[0] and civil[1] > official[1]
+    assert moved != civil
+
+
+def test_night_hours_unchanged_by_cache():
+    dep = datetime.datetime(2020, 1, 1, 15)
+    arr = datetime.datetime(2020, 1, 1, 18)
+    clear_cache()
+    first = night_calc.night_hours(dep, 53.42, -6.27, arr, 51.47, -0.45)
+    second = night_calc.night_hours(dep, 53.42, -6.27, arr, 51.47, -0.45)
+    assert first == second
+    assert first[0] + first[1] == arr - dep
+    assert first[2]
+
+
+def test_stats_hook():
+    import sunrisesunset
+
+    date = datetime.datetime(2020, 3, 1, 12, tzinfo=night_calc.UTC())
+    counts = []
+    clear_cache()
+    try:
+        SunriseSunset.stats = lambda name, amount=1: counts.append((name, amount))
+        SunriseSunset(date, 53.42, -6.27, 'civil').get_sunriseset()
+    finally:
+        SunriseSunset.stats = pipeline_stats.count
+    assert counts[0] == ('solar calculations', 1)
+    assert [name for name, amount in counts[1:]] == ['solar solver iterations'] * 2
+    assert 'pipeline_stats' not in vars(sunrisesunset)